@@ -0,0 +1,244 @@
+import hashlib
+import time
+from functools import partial, wraps
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from rest_framework import status
+from rest_framework.response import Response
+
+from recipes.models import (
+    Favorite,
+    Follow,
+    Ingredient,
+    MealPlan,
+    Recipe,
+    RecipeIngredient,
+    ShoppingList,
+    Tag,
+    User,
+)
+from .db_routers import reads_from_replica
+
+GENERATION_KEY = 'cache_generation:{}'
+
+# Модели, изменения которых сбрасывают кэш, и поле владельца записи:
+# изменение сбрасывает и пространство модели, и пространство владельца.
+TRACKED_MODELS = {
+    Recipe: 'author_id',
+    RecipeIngredient: None,
+    Tag: None,
+    Ingredient: None,
+    User: None,
+    Follow: 'user_id',
+    Favorite: 'user_id',
+    ShoppingList: 'user_id',
+    MealPlan: 'user_id',
+}
+
+# Модели, строки которых удаляются пачкой через filter().delete().
+# post_delete для них отключил бы быстрое удаление одним DELETE и
+# сбрасывал бы кэш на каждую строку, поэтому после удаления кэш
+# сбрасывается один раз явно: в представлениях, сериализаторе и админке
+# (invalidate_deleted), а при каскаде - по удалению родительской записи.
+FAST_DELETE_MODELS = (
+    Favorite,
+    Follow,
+    ShoppingList,
+    RecipeIngredient,
+    MealPlan,
+)
+
+
+def model_namespace(model):
+    return model._meta.label_lower
+
+
+def owner_namespace(user_id):
+    return f'user:{user_id}'
+
+
+def new_generation():
+    """
+    Начальное поколение пространства. Берется из времени, чтобы после
+    вытеснения счетчика из кэша не вернуть одно из прежних значений.
+    """
+    return time.time_ns()
+
+
+def bump_now(namespaces):
+    for namespace in namespaces:
+        key = GENERATION_KEY.format(namespace)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, new_generation(), None)
+
+
+def bump(*namespaces):
+    """
+    Сбрасывает кэш пространств: одна операция с кэшем на каждое.
+    Внутри транзакции сброс откладывается до ее фиксации, чтобы
+    параллельный запрос не закэшировал данные до изменения.
+    """
+    transaction.on_commit(partial(bump_now, namespaces))
+
+
+def get_generations(namespaces):
+    """Текущие поколения пространств одним запросом к кэшу."""
+    keys = [GENERATION_KEY.format(namespace) for namespace in namespaces]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, new_generation(), None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def make_key(prefix, namespaces, *parts):
+    """
+    Ключ кэша, зависящий от поколений пространств: после bump любого
+    из них ключ меняется, а старые записи истекают по таймауту.
+    """
+    source = repr((get_generations(namespaces), parts))
+    return '{}:{}'.format(prefix, hashlib.md5(source.encode()).hexdigest())
+
+
+def is_shared_cache():
+    """
+    Кэш общий для всех воркеров. Кэш в памяти процесса не подходит:
+    bump в одном воркере не сбросил бы записи, сохраненные другими.
+    """
+    return not isinstance(caches[DEFAULT_CACHE_ALIAS], LocMemCache)
+
+
+def capped_timeout(timeout):
+    """
+    Данные с реплики могут быть прочитаны до записи, которая уже
+    сменила поколение, поэтому хранятся не дольше отставания реплики.
+    """
+    if reads_from_replica():
+        return min(timeout, settings.REPLICA_PIN_SECONDS)
+    return timeout
+
+
+def query_namespaces(sql, connection):
+    """
+    Пространства отслеживаемых моделей, таблицы которых есть в тексте
+    запроса, включая подзапросы.
+    """
+    return [
+        model_namespace(model)
+        for model in TRACKED_MODELS
+        if connection.ops.quote_name(model._meta.db_table) in sql
+    ]
+
+
+def cached_action(models=(), per_user=False, timeout=None):
+    """
+    Кэширует данные успешного ответа действия ViewSet.
+    Запись зависит от пространств перечисленных моделей, а при
+    per_user=True - еще и от пространства текущего пользователя.
+    Без общего для воркеров кэша ответы не кэшируются.
+    """
+    namespaces = [model_namespace(model) for model in models]
+    if timeout is None:
+        timeout = settings.VIEW_CACHE_TIMEOUT
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            if not is_shared_cache():
+                return method(self, request, *args, **kwargs)
+            user_id = request.user.id if per_user else None
+            key_namespaces = list(namespaces)
+            if user_id is not None:
+                key_namespaces.append(owner_namespace(user_id))
+            cache_key = make_key(
+                'view',
+                key_namespaces,
+                type(self).__name__,
+                method.__name__,
+                request.get_host(),
+                request.get_full_path(),
+                user_id,
+            )
+            data = cache.get(cache_key)
+            if data is not None:
+                return Response(data)
+            response = method(self, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                cache.set(cache_key, response.data, capped_timeout(timeout))
+            return response
+        return wrapper
+    return decorator
+
+
+def cascade_namespaces(model):
+    """
+    Пространства моделей из FAST_DELETE_MODELS, строки которых удаляются
+    каскадом вместе с записью model без post_delete.
+    """
+    return [
+        model_namespace(related)
+        for related in FAST_DELETE_MODELS
+        if any(
+            field.related_model is model
+            for field in related._meta.fields
+            if field.many_to_one
+        )
+    ]
+
+
+def invalidate_deleted(model, owner_ids=()):
+    """
+    Сбрасывает кэш после удаления строк модели из FAST_DELETE_MODELS:
+    одна операция на пространство модели и на каждого владельца.
+    """
+    bump(
+        model_namespace(model),
+        *(owner_namespace(owner_id) for owner_id in set(owner_ids)),
+    )
+
+
+def invalidate_instance(sender, instance, signal, **kwargs):
+    """Сбрасывает пространства модели и владельца измененной записи."""
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    owner_field = TRACKED_MODELS[sender]
+    namespaces = [model_namespace(sender)]
+    if owner_field is not None:
+        namespaces.append(owner_namespace(getattr(instance, owner_field)))
+    if signal is post_delete:
+        namespaces.extend(cascade_namespaces(sender))
+    bump(*namespaces)
+
+
+def invalidate_recipe_tags(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump(model_namespace(Recipe))
+
+
+def connect_signals():
+    for model in TRACKED_MODELS:
+        post_save.connect(
+            invalidate_instance,
+            sender=model,
+            dispatch_uid=f'cache_invalidate_save_{model_namespace(model)}',
+        )
+        if model in FAST_DELETE_MODELS:
+            continue
+        post_delete.connect(
+            invalidate_instance,
+            sender=model,
+            dispatch_uid=f'cache_invalidate_delete_{model_namespace(model)}',
+        )
+    m2m_changed.connect(
+        invalidate_recipe_tags,
+        sender=Recipe.tags.through,
+        dispatch_uid='cache_invalidate_recipe_tags',
+    )
@@ -0,0 +1,51 @@
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+routing_state = threading.local()
+
+
+def use_replica(enabled):
+    """
+    Включает чтение с реплики для текущего потока.
+    Сбрасывает признак записи, сделанной в этом потоке.
+    """
+    routing_state.use_replica = enabled
+    routing_state.pinned = False
+
+
+def is_pinned():
+    """В текущем запросе уже была запись в основную БД."""
+    return getattr(routing_state, 'pinned', False)
+
+
+def reads_from_replica():
+    """Чтение в текущем потоке сейчас идет с реплики."""
+    return (
+        getattr(routing_state, 'use_replica', False)
+        and not is_pinned()
+        and settings.REPLICA_DATABASE in settings.DATABASES
+    )
+
+
+class ReplicaRouter:
+    """
+    Чтение идет на реплику, если ее включил ReplicaMiddleware
+    и в текущем запросе еще не было записи. Запись, миграции и любые
+    обращения вне запроса идут в основную БД.
+    """
+    def db_for_read(self, model, **hints):
+        if reads_from_replica():
+            return settings.REPLICA_DATABASE
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        routing_state.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,9 @@
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class PDFRenderUnavailable(APIException):
+    """Очередь формирования pdf переполнена или не уложилась в таймаут."""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Сервис формирования pdf перегружен, попробуйте позже.'
+    default_code = 'pdf_render_unavailable'
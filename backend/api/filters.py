@@ -1,6 +1,15 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import Count, F, FloatField, Q
+from django.db.models.functions import Cast, NullIf
 from django_filters import rest_framework as filters
 
-from recipes.models import Ingredient, Recipe
+from recipes.models import Ingredient, MealPlan, Recipe, Tag
+
+
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    """Фильтр по списку чисел через запятую."""
 
 
 class IngredientFilter(filters.FilterSet):
@@ -18,8 +27,24 @@ class IngredientFilter(filters.FilterSet):
 class RecipeFilter(filters.FilterSet):
     """
     Позволяет фильтровать объекты модели Recipe
-    по полю author, is_favorited, is_in_shopping_cart.
+    по полю author, is_favorited, is_in_shopping_cart, ingredients,
+    искать по тексту (search) и сортировать по популярности.
+    Для ingredients параметр match задает режим поиска:
+    all - рецепты со всеми указанными ингредиентами,
+    any - хотя бы с одним из них,
+    best - рецепты, которые можно приготовить только из указанных.
+    Результат упорядочен по доле ингредиентов рецепта, которые есть.
     """
+    ORDERING_CHOICES = (
+        ('popular', 'popular'),
+        ('trending', 'trending'),
+    )
+    MATCH_CHOICES = (
+        ('all', 'all'),
+        ('any', 'any'),
+        ('best', 'best'),
+    )
+
     def filter_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated:
             return queryset.filter(favorite__user=self.request.user)
@@ -30,12 +55,94 @@ class RecipeFilter(filters.FilterSet):
             return queryset.filter(shopping_list__user=self.request.user)
         return queryset
 
+    def filter_ingredients(self, queryset, name, value):
+        ingredient_ids = {pk for pk in value if pk is not None}
+        if not ingredient_ids:
+            return queryset
+        queryset = queryset.filter(
+            recipe__ingredient__in=ingredient_ids,
+        ).annotate(
+            matched=Count('recipe', distinct=True),
+        ).annotate(
+            coverage=Cast('matched', FloatField()) / NullIf(
+                'ingredients_count',
+                0,
+            ),
+        )
+        match = self.form.cleaned_data.get('match') or 'all'
+        if match == 'all':
+            queryset = queryset.filter(matched=len(ingredient_ids))
+        elif match == 'best':
+            queryset = queryset.filter(matched=F('ingredients_count'))
+        return queryset.order_by('-coverage', '-matched', '-pub_date')
+
+    def filter_match(self, queryset, name, value):
+        return queryset
+
+    def filter_search(self, queryset, name, value):
+        if connections[queryset.db].vendor != 'postgresql':
+            return queryset.filter(
+                Q(name__icontains=value) | Q(text__icontains=value)
+            )
+        query = SearchQuery(
+            value,
+            config=settings.SEARCH_CONFIG,
+            search_type='websearch',
+        )
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query),
+        ).order_by('-rank', '-pub_date')
+
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by(
+            F(f'popularity__{value}').desc(nulls_last=True),
+            '-pub_date',
+        )
+
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart',
     )
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    # Выбор проверяется запросом к тегам из параметра, а не DISTINCT
+    # по всем рецептам, как у AllValuesMultipleFilter.
+    tags = filters.ModelMultipleChoiceFilter(
+        field_name='tags__slug',
+        to_field_name='slug',
+        queryset=Tag.objects.all(),
+    )
+    ingredients = NumberInFilter(method='filter_ingredients')
+    match = filters.ChoiceFilter(
+        choices=MATCH_CHOICES,
+        method='filter_match',
+    )
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(
+        choices=ORDERING_CHOICES,
+        method='filter_ordering',
+    )
 
     class Meta:
         model = Recipe
-        fields = ['author', 'is_favorited', 'is_in_shopping_cart', 'tags']
+        fields = [
+            'author',
+            'is_favorited',
+            'is_in_shopping_cart',
+            'tags',
+            'ingredients',
+            'match',
+            'search',
+            'ordering',
+        ]
+
+
+class MealPlanFilter(filters.FilterSet):
+    """
+    Позволяет выбрать записи плана питания за период:
+    start и end - первый и последний день включительно.
+    """
+    start = filters.DateFilter(field_name='date', lookup_expr='gte')
+    end = filters.DateFilter(field_name='date', lookup_expr='lte')
+
+    class Meta:
+        model = MealPlan
+        fields = ('start', 'end')
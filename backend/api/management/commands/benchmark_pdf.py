@@ -0,0 +1,113 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.utils import get_pdf_pool, render_pdf, render_pdf_in_pool
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает параллельное формирование pdf в потоках воркера и в '
+        'пуле процессов: общее время, задержки запросов и задержку '
+        'легкого запроса, который выполняется в это же время.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=32,
+            help='Число формируемых pdf.',
+        )
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=8,
+            help='Число параллельных потоков, как у воркера gunicorn.',
+        )
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=200,
+            help='Число строк в списке покупок.',
+        )
+
+    @staticmethod
+    def get_rows(count):
+        return [
+            {
+                'total_amount': i + 1,
+                'recipe__ingredients__measurement_unit': 'г',
+                'recipe__ingredients__name': f'Ингредиент {i}',
+                'total_cost': (i + 1) * 0.5,
+            }
+            for i in range(count)
+        ]
+
+    @staticmethod
+    def probe(stop, delays):
+        """
+        Легкий запрос раз в 10 мс: задержка сверх 10 мс - время,
+        которое поток ждал GIL.
+        """
+        while not stop.is_set():
+            started = time.perf_counter()
+            time.sleep(0.01)
+            delays.append(time.perf_counter() - started - 0.01)
+
+    def run(self, render, rows, requests, threads):
+        latencies = []
+
+        def job():
+            started = time.perf_counter()
+            render(rows)
+            latencies.append(time.perf_counter() - started)
+
+        delays = []
+        stop = threading.Event()
+        prober = threading.Thread(target=self.probe, args=(stop, delays))
+        prober.start()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            for future in [executor.submit(job) for _ in range(requests)]:
+                future.result()
+        total = time.perf_counter() - started
+        stop.set()
+        prober.join()
+        return total, latencies, delays
+
+    def report(self, title, total, latencies, delays):
+        latencies.sort()
+        self.stdout.write(
+            f'{title}: всего {total:.2f} с, '
+            f'запрос p50 {statistics.median(latencies) * 1000:.0f} мс, '
+            f'max {latencies[-1] * 1000:.0f} мс, '
+            f'задержка легкого запроса max {max(delays) * 1000:.1f} мс'
+        )
+
+    def handle(self, *args, **options):
+        rows = self.get_rows(options['rows'])
+        requests, threads = options['requests'], options['threads']
+        self.report(
+            'Потоки',
+            *self.run(render_pdf, rows, requests, threads),
+        )
+        if not settings.PDF_POOL_WORKERS:
+            self.stdout.write('Пул процессов выключен (PDF_POOL_WORKERS=0).')
+            return
+        # Запуск процессов пула не входит в замер.
+        get_pdf_pool()
+        render_pdf_in_pool(rows, wait=True)
+        self.report(
+            f'Пул из {settings.PDF_POOL_WORKERS} процессов',
+            *self.run(
+                lambda rows: render_pdf_in_pool(rows, wait=True),
+                rows,
+                requests,
+                threads,
+            ),
+        )
@@ -0,0 +1,76 @@
+import json
+import statistics
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.renderers import FastJSONRenderer, orjson
+from api.representations import RecipeRepresentation
+from api.serializers import IngredientSerializer
+from recipes.models import Ingredient, Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает JSONRenderer и FastJSONRenderer на данных из БД: '
+        'список ингредиентов и страница рецептов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=200,
+            help='Число замеров на каждый ответ.',
+        )
+        parser.add_argument(
+            '--recipes',
+            type=int,
+            default=6,
+            help='Число рецептов на странице.',
+        )
+
+    def get_payloads(self, limit):
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = AnonymousUser()
+        representation = RecipeRepresentation(request)
+        return {
+            'Ингредиенты': IngredientSerializer(
+                Ingredient.objects.all(),
+                many=True,
+            ).data,
+            'Рецепты': representation.to_data(
+                representation.values(Recipe.objects.all()[:limit])
+            ),
+        }
+
+    @staticmethod
+    def measure(renderer, data, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            renderer.render(data)
+            timings.append(time.perf_counter() - started)
+        return statistics.median(timings)
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write('orjson не установлен, сравнивать не с чем.')
+            return
+        for title, data in self.get_payloads(options['recipes']).items():
+            slow, fast = JSONRenderer(), FastJSONRenderer()
+            rendered = slow.render(data)
+            # Побайтно вывод может отличаться, например, записью float.
+            if json.loads(fast.render(data)) != json.loads(rendered):
+                self.stderr.write(f'{title}: ответы различаются.')
+            self.stdout.write(
+                f'{title} ({len(data)} шт., {len(rendered)} байт): '
+                f'JSONRenderer '
+                f'{self.measure(slow, data, options["repeat"]) * 1e6:.0f} мкс, '
+                f'FastJSONRenderer '
+                f'{self.measure(fast, data, options["repeat"]) * 1e6:.0f} мкс'
+            )
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from api.tasks import delete_expired_exports, fail_stale_exports
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет устаревшие pdf списков покупок и помечает ошибкой '
+        'зависшие задания'
+    )
+
+    def handle(self, *args, **options):
+        failed = fail_stale_exports()
+        deleted = delete_expired_exports()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Удалено выгрузок: {deleted}, зависших заданий: {failed}'
+            )
+        )
@@ -0,0 +1,95 @@
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+from django.utils.text import compress_string
+
+from .db_routers import is_pinned, use_replica
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+re_accepts_gzip = _lazy_re_compile(r'\bgzip\b')
+re_accepts_brotli = _lazy_re_compile(r'\bbr\b')
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Сжимает ответы с типами из COMPRESSION_CONTENT_TYPES, если их размер
+    не меньше заданного для типа порога. Использует brotli, если он
+    установлен и поддерживается клиентом, иначе gzip.
+    """
+    def get_min_length(self, response):
+        content_type = response.get('Content-Type', '').split(';')[0].strip()
+        return settings.COMPRESSION_CONTENT_TYPES.get(content_type)
+
+    def compress(self, request, content):
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if brotli is not None and re_accepts_brotli.search(accept_encoding):
+            return 'br', brotli.compress(content)
+        if re_accepts_gzip.search(accept_encoding):
+            return 'gzip', compress_string(content)
+        return None, content
+
+    def process_response(self, request, response):
+        min_length = self.get_min_length(response)
+        if (
+            min_length is None
+            or response.streaming
+            or response.has_header('Content-Encoding')
+            or len(response.content) < min_length
+        ):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        encoding, compressed_content = self.compress(
+            request,
+            response.content,
+        )
+        if encoding is None or len(compressed_content) >= len(
+            response.content
+        ):
+            return response
+        response.content = compressed_content
+        response.headers['Content-Length'] = str(len(response.content))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+
+        return response
+
+
+class ReplicaMiddleware:
+    """
+    Направляет чтение в GET и HEAD запросах на реплику.
+    После записи клиент получает cookie REPLICA_PIN_COOKIE и следующие
+    REPLICA_PIN_SECONDS секунд читает из основной БД, чтобы видеть
+    свои изменения, пока реплика догоняет основную БД.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        use_replica(
+            request.method in ('GET', 'HEAD')
+            and settings.REPLICA_PIN_COOKIE not in request.COOKIES
+        )
+        try:
+            response = self.get_response(request)
+            pinned = is_pinned()
+        finally:
+            use_replica(False)
+        if pinned:
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE,
+                '1',
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
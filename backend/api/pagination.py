@@ -0,0 +1,152 @@
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import EmptyPage, Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import (
+    CursorPagination,
+    LimitOffsetPagination,
+    PageNumberPagination,
+)
+
+from .caching import capped_timeout, is_shared_cache, make_key, query_namespaces
+
+
+class FeedPagination(CursorPagination):
+    """
+    Курсорная (keyset) пагинация ленты рецептов по дате публикации.
+    Страница выбирается по индексу без OFFSET.
+    """
+    ordering = '-pub_date'
+    page_size_query_param = 'limit'
+
+
+def get_estimated_count(queryset):
+    """
+    Оценка числа строк таблицы по статистике PostgreSQL (reltuples).
+    Возвращает None для других СУБД и для таблиц без статистики.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+            [queryset.model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+def get_count(queryset, exact=False):
+    """
+    Число объектов для пагинации и признак того, что оно оценочное.
+    Для списка без фильтров берется оценка по статистике, если таблица
+    больше ESTIMATED_COUNT_THRESHOLD. Точный COUNT для отфильтрованного
+    списка кэшируется на PAGINATION_COUNT_CACHE_TIMEOUT секунд по тексту
+    и параметрам запроса и поколениям моделей, таблицы которых в нем
+    есть: запись в избранное, план питания или подписки сразу меняет
+    ключ. exact=True всегда выполняет точный COUNT.
+    """
+    if exact:
+        return queryset.count(), False
+    query = queryset.query
+    if not (query.has_filters() or query.is_sliced or query.distinct):
+        estimate = get_estimated_count(queryset)
+        if (
+            estimate is not None
+            and estimate >= settings.ESTIMATED_COUNT_THRESHOLD
+        ):
+            return estimate, True
+        return queryset.count(), False
+    try:
+        sql, params = query.sql_with_params()
+    except EmptyResultSet:
+        # Фильтр заведомо ничего не выбирает, например пустой IN.
+        return 0, False
+    if not is_shared_cache():
+        return queryset.count(), False
+    cache_key = make_key(
+        'pagination_count',
+        query_namespaces(sql, connections[queryset.db]),
+        queryset.db,
+        sql,
+        params,
+    )
+    count = cache.get(cache_key)
+    if count is None:
+        count = queryset.count()
+        cache.set(
+            cache_key,
+            count,
+            capped_timeout(settings.PAGINATION_COUNT_CACHE_TIMEOUT),
+        )
+    return count, False
+
+
+def is_exact_count(request):
+    """Точный подсчет запрошен параметром exact_count."""
+    return request.query_params.get('exact_count', '').lower() in (
+        '1',
+        'true',
+    )
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator с приблизительным count. При оценочном count страницы
+    не обрезаются по нему: если оценка занижена, последние объекты
+    остаются доступны.
+    """
+    def __init__(self, *args, exact=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.exact = exact
+        self.estimated = False
+
+    @cached_property
+    def count(self):
+        count, self.estimated = get_count(self.object_list, self.exact)
+        return count
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            if not self.estimated or int(number) < 1:
+                raise
+            return int(number)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(
+            self.object_list[bottom:bottom + self.per_page],
+            number,
+            self,
+        )
+
+
+class EstimatedPageNumberPagination(PageNumberPagination):
+    """PageNumberPagination с приблизительным count в ответе."""
+    def paginate_queryset(self, queryset, request, view=None):
+        self.django_paginator_class = partial(
+            EstimatedCountPaginator,
+            exact=is_exact_count(request),
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+
+class EstimatedLimitOffsetPagination(LimitOffsetPagination):
+    """LimitOffsetPagination с приблизительным count в ответе."""
+    def paginate_queryset(self, queryset, request, view=None):
+        self.exact = is_exact_count(request)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_count(self, queryset):
+        count, _ = get_count(queryset, self.exact)
+        return count
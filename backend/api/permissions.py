@@ -7,5 +7,5 @@ class IsAuthor(permissions.BasePermission):
         return (
             request.method in permissions.SAFE_METHODS
             or request.user.is_authenticated
-            and obj.author == request.user
+            and obj.author_id == request.user.id
         )
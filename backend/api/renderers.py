@@ -0,0 +1,46 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Рендерит JSON через orjson, если он установлен.
+    Типы, которые orjson не умеет (ленивые строки, Decimal, datetime),
+    кодируются так же, как в стандартном JSONRenderer.
+    При отступах или ошибке используется стандартный рендерер.
+    После разбора JSON совпадает с JSONRenderer, но не побайтно:
+    float orjson пишет иначе (1e16 вместо 1e+16), а NaN и бесконечность
+    отдает как null там, где JSONRenderer завершается ошибкой.
+    """
+    if orjson is not None:
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data,
+                default=JSONEncoder().default,
+                option=self.options,
+            )
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace(
+            '\u2028'.encode(),
+            b'\\u2028',
+        ).replace(
+            '\u2029'.encode(),
+            b'\\u2029',
+        )
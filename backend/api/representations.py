@@ -0,0 +1,235 @@
+from collections import defaultdict
+
+from django.db.models import Exists, OuterRef, Subquery
+
+from recipes.models import (
+    Favorite,
+    Follow,
+    Recipe,
+    RecipeIngredient,
+    ShoppingList,
+)
+
+IMAGE_STORAGE = Recipe._meta.get_field('image').storage
+
+
+def get_image_url(name, request=None):
+    """Повторяет ImageField.to_representation для имени файла."""
+    if not name:
+        return None
+    url = IMAGE_STORAGE.url(name)
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def get_followed_ids(request, user_ids):
+    """Возвращает id из user_ids, на которые подписан текущий пользователь."""
+    if request is None or request.user.is_anonymous:
+        return set()
+    return set(
+        Follow.objects.filter(
+            user=request.user,
+            following_id__in=user_ids,
+        ).values_list('following_id', flat=True)
+    )
+
+
+class RecipeRepresentation:
+    """
+    Представление рецептов для чтения без обхода полей сериализатора.
+    Строит из строк .values() те же данные, что и RecipelistSerializer,
+    загружая теги, ингредиенты и подписки по одному запросу на страницу.
+    """
+    values_fields = (
+        'id',
+        'name',
+        'image',
+        'text',
+        'cooking_time',
+        'pub_date',
+        'calories',
+        'proteins',
+        'fats',
+        'carbohydrates',
+        'cost',
+        'author_id',
+        'author__email',
+        'author__username',
+        'author__first_name',
+        'author__last_name',
+    )
+    flag_fields = ('favorited', 'in_shopping_cart')
+    flag_models = {'favorited': Favorite, 'in_shopping_cart': ShoppingList}
+
+    def __init__(self, request):
+        self.request = request
+
+    def annotate(self, queryset, flags=flag_fields):
+        """Добавляет отметки избранного и корзины текущего пользователя."""
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset
+        return queryset.annotate(**{
+            flag: Exists(
+                self.flag_models[flag].objects.filter(
+                    user=user,
+                    recipe=OuterRef('pk'),
+                )
+            )
+            for flag in flags
+            if flag not in queryset.query.annotations
+        })
+
+    def values(self, queryset):
+        """Превращает queryset рецептов в queryset строк для to_data."""
+        annotations = queryset.query.annotations
+        return queryset.values(
+            *self.values_fields,
+            *(name for name in self.flag_fields if name in annotations),
+        )
+
+    def get_tags(self, recipe_ids):
+        tags = defaultdict(list)
+        rows = Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids,
+        ).order_by('tag__name').values_list(
+            'recipe_id',
+            'tag_id',
+            'tag__name',
+            'tag__color',
+            'tag__slug',
+        )
+        for recipe_id, tag_id, name, color, slug in rows:
+            tags[recipe_id].append({
+                'id': tag_id,
+                'name': name,
+                'color': color,
+                'slug': slug,
+            })
+        return tags
+
+    def get_ingredients(self, recipe_ids):
+        ingredients = defaultdict(list)
+        rows = RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids,
+        ).order_by('id').values_list(
+            'recipe_id',
+            'ingredient_id',
+            'ingredient__name',
+            'ingredient__measurement_unit',
+            'amount',
+        )
+        for recipe_id, ingredient_id, name, measurement_unit, amount in rows:
+            ingredients[recipe_id].append({
+                'id': ingredient_id,
+                'name': name,
+                'measurement_unit': measurement_unit,
+                'amount': amount,
+            })
+        return ingredients
+
+    def to_data(self, rows):
+        rows = list(rows)
+        recipe_ids = [row['id'] for row in rows]
+        tags = self.get_tags(recipe_ids)
+        ingredients = self.get_ingredients(recipe_ids)
+        followed = get_followed_ids(
+            self.request,
+            {row['author_id'] for row in rows},
+        )
+        return [
+            {
+                'id': row['id'],
+                'tags': tags[row['id']],
+                'author': {
+                    'email': row['author__email'],
+                    'id': row['author_id'],
+                    'username': row['author__username'],
+                    'first_name': row['author__first_name'],
+                    'last_name': row['author__last_name'],
+                    'is_subscribed': row['author_id'] in followed,
+                },
+                'ingredients': ingredients[row['id']],
+                'is_favorited': row.get('favorited', False),
+                'is_in_shopping_cart': row.get('in_shopping_cart', False),
+                'name': row['name'],
+                'image': get_image_url(row['image'], self.request),
+                'text': row['text'],
+                'cooking_time': row['cooking_time'],
+                'calories': row['calories'],
+                'proteins': row['proteins'],
+                'fats': row['fats'],
+                'carbohydrates': row['carbohydrates'],
+                'cost': row['cost'],
+            }
+            for row in rows
+        ]
+
+
+class SubscriptionRepresentation:
+    """
+    Представление подписок для чтения без обхода полей сериализатора.
+    Строит те же данные, что и SubscriptionsSerializer.
+    """
+    values_fields = (
+        'email',
+        'id',
+        'username',
+        'first_name',
+        'last_name',
+        'recipes_count',
+    )
+
+    def __init__(self, request):
+        self.request = request
+
+    def values(self, queryset):
+        return queryset.values(*self.values_fields)
+
+    def get_recipes(self, author_ids):
+        recipes_limit = self.request.GET.get('recipes_limit')
+        queryset = Recipe.objects.filter(author_id__in=author_ids)
+        if recipes_limit is not None:
+            queryset = queryset.filter(
+                id__in=Subquery(
+                    Recipe.objects.filter(
+                        author_id=OuterRef('author_id'),
+                    ).values('id')[:int(recipes_limit)]
+                )
+            )
+        recipes = defaultdict(list)
+        rows = queryset.values_list(
+            'author_id',
+            'id',
+            'name',
+            'image',
+            'cooking_time',
+        )
+        for author_id, recipe_id, name, image, cooking_time in rows:
+            recipes[author_id].append({
+                'id': recipe_id,
+                'name': name,
+                'image': get_image_url(image),
+                'cooking_time': cooking_time,
+            })
+        return recipes
+
+    def to_data(self, rows):
+        rows = list(rows)
+        author_ids = [row['id'] for row in rows]
+        recipes = self.get_recipes(author_ids)
+        followed = get_followed_ids(self.request, author_ids)
+        return [
+            {
+                'email': row['email'],
+                'id': row['id'],
+                'username': row['username'],
+                'first_name': row['first_name'],
+                'last_name': row['last_name'],
+                'is_subscribed': row['id'] in followed,
+                'recipes': recipes[row['id']],
+                'recipes_count': row['recipes_count'],
+            }
+            for row in rows
+        ]
@@ -1,11 +1,12 @@
 import base64
+from functools import partial
 
 from djoser.serializers import UserSerializer as DjoserUserSerializer
 from django.conf import settings
 from django.core.files.base import ContentFile
-from django.core.exceptions import ObjectDoesNotExist
+from django.db import IntegrityError, connection, transaction
 from rest_framework import serializers
-from rest_framework.validators import UniqueTogetherValidator
+from rest_framework.settings import api_settings
 
 from recipes.models import (
     Tag,
@@ -14,9 +15,14 @@ from recipes.models import (
     User,
     RecipeIngredient,
     ShoppingList,
+    ShoppingListExport,
     Favorite,
     Follow,
+    MealPlan,
 )
+from recipes.utils import update_recipe_totals
+from .caching import bump, model_namespace, owner_namespace
+from .utils import get_query_list
 
 
 class Base64ImageField(serializers.ImageField):
@@ -30,6 +36,29 @@ class Base64ImageField(serializers.ImageField):
         return super().to_internal_value(data)
 
 
+class SparseFieldsMixin:
+    """
+    Оставляет в ответе только поля из параметра запроса fields.
+    Вложенные объекты из expandable_fields при этом отдаются своим id,
+    если они не перечислены в параметре expand.
+    Без параметра fields ответ не меняется.
+    """
+    expandable_fields = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        fields = get_query_list(request, 'fields')
+        if fields is None:
+            return
+        expand = get_query_list(request, 'expand') or set()
+        for name in set(self.fields) - fields:
+            self.fields.pop(name)
+        for name, field_class in self.expandable_fields.items():
+            if name in self.fields and name not in expand:
+                self.fields[name] = field_class()
+
+
 class TagSerializer(serializers.ModelSerializer):
     """Сериализатор для модели Tag."""
     class Meta:
@@ -44,7 +73,7 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit')
 
 
-class UserSerializer(DjoserUserSerializer):
+class UserSerializer(SparseFieldsMixin, DjoserUserSerializer):
     """Сериализатор для модели User."""
     is_subscribed = serializers.SerializerMethodField()
 
@@ -60,10 +89,19 @@ class UserSerializer(DjoserUserSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        """
+        Подписки текущего пользователя загружаются одним запросом
+        и хранятся в контексте, общем для всех вложенных сериализаторов.
+        """
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
-        return request.user.follower.filter(following=obj).exists()
+        followed_ids = self.context.get('followed_ids')
+        if followed_ids is None:
+            followed_ids = self.context['followed_ids'] = set(
+                request.user.follower.values_list('following_id', flat=True)
+            )
+        return obj.id in followed_ids
 
 
 class IngredientAmountSerializer(serializers.ModelSerializer):
@@ -91,7 +129,7 @@ class RecipeInfoSerializer(serializers.ModelSerializer):
         )
 
 
-class RecipelistSerializer(serializers.ModelSerializer):
+class RecipelistSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Сериализатор для Recipe GET."""
     tags = TagSerializer(read_only=True, many=True)
     image = Base64ImageField()
@@ -100,6 +138,18 @@ class RecipelistSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
 
+    expandable_fields = {
+        'author': partial(
+            serializers.PrimaryKeyRelatedField,
+            read_only=True,
+        ),
+        'tags': partial(
+            serializers.PrimaryKeyRelatedField,
+            many=True,
+            read_only=True,
+        ),
+    }
+
     class Meta:
         model = Recipe
         fields = (
@@ -113,18 +163,27 @@ class RecipelistSerializer(serializers.ModelSerializer):
             'image',
             'text',
             'cooking_time',
+            'calories',
+            'proteins',
+            'fats',
+            'carbohydrates',
+            'cost',
         )
 
     def get_is_favorited(self, obj):
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
+        if hasattr(obj, 'favorited'):
+            return obj.favorited
         return request.user.favorite.filter(recipe=obj).exists()
 
     def get_is_in_shopping_cart(self, obj):
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
+        if hasattr(obj, 'in_shopping_cart'):
+            return obj.in_shopping_cart
         return request.user.shopping_list.filter(recipe=obj).exists()
 
 
@@ -185,30 +244,39 @@ class RecipeSerializer(serializers.ModelSerializer):
                     'Теги не должны повторяться!!'
                 )
             tags_ids.add(tag)
-        return data
-
-    def create_ingredients(self, ingredients, recipe):
-        try:
-            RecipeIngredient.objects.bulk_create([
-                RecipeIngredient(
-                    ingredient=Ingredient.objects.get(pk=ingredient.get('id')),
-                    recipe=recipe,
-                    amount=ingredient.get('amount'),
-                ) for ingredient in ingredients]
-            )
-        except ObjectDoesNotExist:
+        if Ingredient.objects.filter(
+            pk__in=ingredient_ids,
+        ).count() != len(ingredient_ids):
             raise serializers.ValidationError(
                 'Указан не существующий ингредиент!'
             )
+        return data
 
+    def create_ingredients(self, ingredients, recipe):
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
+                ingredient_id=ingredient.get('id'),
+                recipe=recipe,
+                amount=ingredient.get('amount'),
+            ) for ingredient in ingredients]
+        )
+        # bulk_create не отправляет post_save.
+        bump(model_namespace(RecipeIngredient))
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients', [])
         tags = validated_data.pop('tags', [])
-        recipe = Recipe.objects.create(**validated_data)
+        recipe = Recipe.objects.create(
+            ingredients_count=len(ingredients),
+            **validated_data,
+        )
         recipe.tags.set(tags)
         self.create_ingredients(ingredients, recipe)
+        update_recipe_totals([recipe.id])
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         instance.image = validated_data.get('image', instance.image)
         instance.name = validated_data.get('name', instance.name)
@@ -219,64 +287,74 @@ class RecipeSerializer(serializers.ModelSerializer):
         )
         instance.tags.set(validated_data.get('tags'))
         ingredients = validated_data.pop('ingredients', [])
+        # Одним DELETE без post_delete: кэш сбрасывает create_ingredients.
+        instance.recipe.all().delete()
         self.create_ingredients(ingredients, instance)
+        instance.ingredients_count = len(ingredients)
         instance.save()
+        update_recipe_totals([instance.id])
         return instance
 
     def to_representation(self, instance):
         if isinstance(instance, Recipe):
-            serializer = RecipelistSerializer(instance)
+            serializer = RecipelistSerializer(instance, context=self.context)
         return serializer.data
 
 
-class ShoppingListSerializer(serializers.ModelSerializer):
+class UniqueCreateMixin:
+    """
+    Создает объект одним INSERT, полагаясь на уникальное ограничение в БД.
+    Нарушение ограничения возвращается как ошибка валидации.
+    """
+    unique_message = None
+
+    def create(self, validated_data):
+        try:
+            with transaction.atomic():
+                return super().create(validated_data)
+        except IntegrityError:
+            raise serializers.ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: [self.unique_message]},
+                code='unique',
+            )
+
+
+class ShoppingListSerializer(UniqueCreateMixin, serializers.ModelSerializer):
     """Сериализатор для модели ShoppingList."""
+    unique_message = 'Рецепт уже добавлен!'
+
     class Meta:
         model = ShoppingList
         fields = (
             'user',
             'recipe',
         )
-        validators = [
-            UniqueTogetherValidator(
-                queryset=ShoppingList.objects.all(),
-                fields=('user', 'recipe'),
-                message='Рецепт уже добавлен!'
-
-            )
-        ]
+        read_only_fields = fields
+        validators = []
 
 
-class FavoriteSerializer(serializers.ModelSerializer):
+class FavoriteSerializer(UniqueCreateMixin, serializers.ModelSerializer):
     """Сериализатор для модули Favorite."""
+    unique_message = 'Рецепт уже добавлен!'
+
     class Meta:
         model = Favorite
         fields = ('user', 'recipe')
-        validators = [
-            UniqueTogetherValidator(
-                queryset=Favorite.objects.all(),
-                fields=('user', 'recipe'),
-                message='Рецепт уже добавлен!'
-
-            )
-        ]
+        read_only_fields = fields
+        validators = []
 
 
-class FollowSerializer(serializers.ModelSerializer):
+class FollowSerializer(UniqueCreateMixin, serializers.ModelSerializer):
     """Сериализатор для модели Follow."""
+    unique_message = 'Вы уже подписаны!!!'
+
     class Meta:
         model = Follow
         fields = (
             'user',
             'following',
         )
-        validators = [
-            UniqueTogetherValidator(
-                queryset=Follow.objects.all(),
-                fields=('user', 'following'),
-                message='Вы уже подписаны!!!',
-            )
-        ]
+        validators = []
 
     def validate(self, data):
         if data.get('user') == data.get('following'):
@@ -311,4 +389,63 @@ class SubscriptionsSerializer(UserSerializer):
         return info_recipe.data
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipe.count()
+
+
+class ShoppingListExportSerializer(serializers.ModelSerializer):
+    """Сериализатор для заданий на формирование pdf списка покупок."""
+    class Meta:
+        model = ShoppingListExport
+        fields = ('id', 'status', 'created')
+
+
+class MealPlanListSerializer(serializers.ListSerializer):
+    """
+    Добавляет в план несколько записей сразу: существование рецептов
+    проверяется одним запросом, записи сохраняются одним INSERT.
+    """
+    def validate(self, data):
+        recipe_ids = {item['recipe_id'] for item in data}
+        if Recipe.objects.filter(
+            pk__in=recipe_ids,
+        ).count() != len(recipe_ids):
+            raise serializers.ValidationError('Указан не существующий рецепт!')
+        return data
+
+    def create(self, validated_data):
+        meal_plan = [MealPlan(**item) for item in validated_data]
+        if connection.features.can_return_rows_from_bulk_insert:
+            MealPlan.objects.bulk_create(meal_plan)
+        else:
+            for item in meal_plan:
+                item.save()
+        # bulk_create не отправляет post_save.
+        bump(
+            model_namespace(MealPlan),
+            *{owner_namespace(item.user_id) for item in meal_plan},
+        )
+        return meal_plan
+
+
+class MealPlanSerializer(serializers.ModelSerializer):
+    """Сериализатор для модели MealPlan."""
+    recipe = serializers.IntegerField(source='recipe_id')
+    servings = serializers.IntegerField(
+        min_value=settings.SERVINGS_MIN,
+        max_value=settings.SERVINGS_MAX,
+        required=False,
+    )
+
+    class Meta:
+        model = MealPlan
+        fields = ('id', 'date', 'recipe', 'servings')
+        list_serializer_class = MealPlanListSerializer
+
+    def validate_recipe(self, value):
+        if self.parent is None and not Recipe.objects.filter(
+            pk=value,
+        ).exists():
+            raise serializers.ValidationError('Указан не существующий рецепт!')
+        return value
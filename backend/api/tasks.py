@@ -0,0 +1,129 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.utils import timezone
+
+from recipes.models import ShoppingListExport
+from .exceptions import PDFRenderUnavailable
+from .utils import render_pdf_in_pool
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.PDF_EXPORT_WORKERS,
+    thread_name_prefix='pdf-export',
+)
+# Очередь ThreadPoolExecutor не ограничена, поэтому число заданий
+# в очереди и в работе считается отдельно.
+export_queue_lock = threading.Lock()
+export_queue_size = 0
+
+
+def is_export_queue_full():
+    with export_queue_lock:
+        return export_queue_size >= settings.PDF_EXPORT_MAX_QUEUED
+
+
+def reserve_export_slot():
+    """Занимает место в очереди, False - очередь заполнена."""
+    global export_queue_size
+    with export_queue_lock:
+        if export_queue_size >= settings.PDF_EXPORT_MAX_QUEUED:
+            return False
+        export_queue_size += 1
+        return True
+
+
+def release_export_slot(future):
+    global export_queue_size
+    with export_queue_lock:
+        export_queue_size -= 1
+
+
+def render_export(export_id, ingredient_list):
+    """
+    Формирует pdf для задания и сохраняет его в MEDIA_ROOT.
+    Готовым становится только ожидающее задание: то, что уже помечено
+    ошибкой в fail_stale_exports, не меняется, а файл удаляется.
+    """
+    try:
+        content = render_pdf_in_pool(ingredient_list, wait=True)
+        export = ShoppingListExport(pk=export_id)
+        export.file.save(f'{export_id}.pdf', ContentFile(content), save=False)
+        if not ShoppingListExport.objects.filter(
+            pk=export_id,
+            status=ShoppingListExport.PENDING,
+        ).update(file=export.file.name, status=ShoppingListExport.READY):
+            export.file.delete(save=False)
+    except Exception:
+        logger.exception('Не удалось сформировать pdf %s', export_id)
+        ShoppingListExport.objects.filter(
+            pk=export_id,
+            status=ShoppingListExport.PENDING,
+        ).update(status=ShoppingListExport.FAILED)
+    finally:
+        connections.close_all()
+
+
+def submit_export(export_id, rows):
+    """
+    Ставит задание в очередь после фиксации транзакции. Если очередь
+    успели заполнить параллельные запросы, задание помечается ошибкой.
+    """
+    if not reserve_export_slot():
+        ShoppingListExport.objects.filter(pk=export_id).update(
+            status=ShoppingListExport.FAILED,
+        )
+        return
+    executor.submit(render_export, export_id, rows).add_done_callback(
+        release_export_slot,
+    )
+
+
+def enqueue_export(user, ingredient_list):
+    """
+    Создает задание и ставит формирование pdf в очередь.
+    При заполненной очереди (PDF_EXPORT_MAX_QUEUED) отвечает 503.
+    """
+    if is_export_queue_full():
+        raise PDFRenderUnavailable
+    delete_expired_exports(user.shopping_list_exports.all())
+    export = ShoppingListExport.objects.create(user=user)
+    rows = list(ingredient_list)
+    transaction.on_commit(lambda: submit_export(export.pk, rows))
+    return export
+
+
+def delete_expired_exports(queryset=None):
+    """Удаляет задания старше PDF_EXPORT_TTL вместе с файлами."""
+    if queryset is None:
+        queryset = ShoppingListExport.objects.all()
+    expired = queryset.filter(
+        created__lt=timezone.now() - timedelta(
+            seconds=settings.PDF_EXPORT_TTL,
+        ),
+    )
+    for export in expired:
+        if export.file:
+            export.file.delete(save=False)
+    return expired.delete()[0]
+
+
+def fail_stale_exports(queryset=None):
+    """
+    Помечает ошибкой задания, ожидающие дольше PDF_EXPORT_PENDING_TIMEOUT:
+    очередь хранится в памяти воркера и теряется при его перезапуске.
+    """
+    if queryset is None:
+        queryset = ShoppingListExport.objects.all()
+    return queryset.filter(
+        status=ShoppingListExport.PENDING,
+        created__lt=timezone.now() - timedelta(
+            seconds=settings.PDF_EXPORT_PENDING_TIMEOUT,
+        ),
+    ).update(status=ShoppingListExport.FAILED)
@@ -0,0 +1,1291 @@
+import json
+import os
+import signal
+import tempfile
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connections
+from django.db.models import Count
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from recipes.models import (
+    Favorite,
+    Follow,
+    Ingredient,
+    MealPlan,
+    Recipe,
+    RecipeIngredient,
+    RecipePopularity,
+    RecipeSimilarity,
+    ShoppingList,
+    ShoppingListExport,
+    Tag,
+    User,
+)
+from . import tasks, utils
+from .caching import get_generations, model_namespace, owner_namespace
+from .db_routers import use_replica
+from .exceptions import PDFRenderUnavailable
+from .pagination import get_count
+from .renderers import FastJSONRenderer
+from .representations import RecipeRepresentation, SubscriptionRepresentation
+from .serializers import RecipelistSerializer, SubscriptionsSerializer
+from .throttling import TokenBucketThrottle
+from .views import RecipeViewSet
+
+
+@contextmanager
+def shared_cache():
+    """Общий для процессов файловый кэш вместо кэша в памяти процесса."""
+    with tempfile.TemporaryDirectory() as directory:
+        with override_settings(CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': directory,
+            },
+        }):
+            yield
+
+
+# Данные TestCase не зафиксированы и не видны через соединение реплики,
+# поэтому чтение идет из основной БД. Реплику проверяет ReplicaRoutingTest.
+@override_settings(REPLICA_DATABASE=None)
+class ApiTestCase(TestCase):
+    """Два пользователя с рецептами, тегами и ингредиентами."""
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='author@example.com',
+            username='author',
+            first_name='Автор',
+            last_name='Рецептов',
+            password='password',
+        )
+        cls.reader = User.objects.create_user(
+            email='reader@example.com',
+            username='reader',
+            first_name='Читатель',
+            last_name='Рецептов',
+            password='password',
+        )
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}', slug=f't{i}')
+            for i in range(2)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}', measurement_unit='г')
+            for i in range(3)
+        ]
+        cls.recipes = [
+            cls.create_recipe(cls.author, f'Рецепт {i}') for i in range(3)
+        ]
+
+    @classmethod
+    def create_recipe(cls, author, name):
+        recipe = Recipe.objects.create(
+            author=author,
+            name=name,
+            text=f'Описание: {name}',
+            cooking_time=10,
+            image='recipe/images/test.png',
+            ingredients_count=len(cls.ingredients),
+        )
+        recipe.tags.set(cls.tags)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=i + 1)
+            for i, ingredient in enumerate(cls.ingredients)
+        )
+        return recipe
+
+    def setUp(self):
+        cache.clear()
+        self.anon_client = APIClient()
+        self.author_client = APIClient()
+        self.author_client.force_authenticate(self.author)
+        self.reader_client = APIClient()
+        self.reader_client.force_authenticate(self.reader)
+
+
+class DeleteLinkQueriesTest(ApiTestCase):
+    """Удаление связей пользователя с рецептом или автором одним DELETE."""
+    def test_unfavorite(self):
+        recipe = self.recipes[0]
+        Favorite.objects.create(user=self.reader, recipe=recipe)
+        with self.assertNumQueries(1):
+            response = self.reader_client.delete(
+                f'/api/recipes/{recipe.id}/favorite/'
+            )
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Favorite.objects.exists())
+
+    def test_remove_from_shopping_cart(self):
+        recipe = self.recipes[0]
+        ShoppingList.objects.create(user=self.reader, recipe=recipe)
+        with self.assertNumQueries(1):
+            response = self.reader_client.delete(
+                f'/api/recipes/{recipe.id}/shopping_cart/'
+            )
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(ShoppingList.objects.exists())
+
+    def test_unsubscribe(self):
+        Follow.objects.create(user=self.reader, following=self.author)
+        with self.assertNumQueries(1):
+            response = self.reader_client.delete(
+                f'/api/users/{self.author.id}/subscribe/'
+            )
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Follow.objects.exists())
+
+
+class IngredientFilterTest(ApiTestCase):
+    """Фильтр рецептов по ингредиентам."""
+    def test_empty_ingredients_ignored(self):
+        response = self.anon_client.get('/api/recipes/?ingredients=,')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], len(self.recipes))
+
+    def test_match_all(self):
+        recipe = self.create_recipe(self.reader, 'Без ингредиентов')
+        recipe.recipe.all().delete()
+        ids = ','.join(str(ingredient.id) for ingredient in self.ingredients)
+        response = self.anon_client.get(f'/api/recipes/?ingredients={ids}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {row['id'] for row in response.data['results']},
+            {recipe.id for recipe in self.recipes},
+        )
+
+
+class TagFilterTest(ApiTestCase):
+    """Фильтр рецептов по slug тегов."""
+    def test_tags(self):
+        recipe = self.create_recipe(self.reader, 'Без тегов')
+        recipe.tags.clear()
+        # Проверка slug по тегам, count, страница, теги и ингредиенты.
+        with self.assertNumQueries(5):
+            response = self.anon_client.get('/api/recipes/?tags=t0&tags=t1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], len(self.recipes))
+
+    def test_unknown_tag(self):
+        response = self.anon_client.get('/api/recipes/?tags=missing')
+        self.assertEqual(response.status_code, 400)
+
+
+@skipUnless(
+    os.getenv('INGREDIENT_SEARCH_BENCHMARK_RECIPES'),
+    'Замер поиска по ингредиентам (INGREDIENT_SEARCH_BENCHMARK_RECIPES).',
+)
+@override_settings(REPLICA_DATABASE=None)
+class IngredientSearchBenchmarkTest(TestCase):
+    """
+    Поиск по ингредиентам на большом числе рецептов укладывается
+    в INGREDIENT_SEARCH_BENCHMARK_MS на запрос первой страницы с count.
+    """
+    ingredients = 2000
+    per_recipe = 8
+    runs = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        recipes = int(os.getenv('INGREDIENT_SEARCH_BENCHMARK_RECIPES', 0))
+        author = User.objects.create_user(
+            email='author@example.com',
+            username='author',
+            first_name='Автор',
+            last_name='Рецептов',
+            password='password',
+        )
+        Ingredient.objects.bulk_create(
+            Ingredient(
+                id=i + 1,
+                name=f'Ингредиент {i}',
+                measurement_unit='г',
+            )
+            for i in range(cls.ingredients)
+        )
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    id=i + 1,
+                    author=author,
+                    name=f'Рецепт {i}',
+                    text='Описание',
+                    cooking_time=10,
+                    image='recipe/images/test.png',
+                    ingredients_count=cls.per_recipe,
+                )
+                for i in range(recipes)
+            ),
+            batch_size=5000,
+        )
+        RecipeIngredient.objects.bulk_create(
+            (
+                RecipeIngredient(
+                    recipe_id=i + 1,
+                    ingredient_id=(i * 7919 + j * 104729) % cls.ingredients + 1,
+                    amount=1,
+                )
+                for i in range(recipes)
+                for j in range(cls.per_recipe)
+            ),
+            batch_size=5000,
+        )
+
+    def test_search(self):
+        client = APIClient()
+        ids = ','.join(str(i) for i in range(1, 21))
+        limit = float(os.getenv('INGREDIENT_SEARCH_BENCHMARK_MS', 50))
+        for match in ('all', 'any', 'best'):
+            path = f'/api/recipes/?ingredients={ids}&match={match}&limit=6'
+            timings = []
+            for _ in range(self.runs):
+                cache.clear()
+                started = time.perf_counter()
+                response = client.get(path)
+                timings.append((time.perf_counter() - started) * 1000)
+                self.assertEqual(response.status_code, 200)
+            timings.sort()
+            with self.subTest(match=match, ms=timings[self.runs // 2]):
+                self.assertLess(timings[self.runs // 2], limit)
+
+
+class RepresentationTest(ApiTestCase):
+    """Представления из строк values() совпадают с сериализаторами."""
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.create_recipe(cls.reader, 'Рецепт читателя')
+        Favorite.objects.create(user=cls.reader, recipe=cls.recipes[0])
+        ShoppingList.objects.create(user=cls.reader, recipe=cls.recipes[1])
+        Follow.objects.create(user=cls.reader, following=cls.author)
+        Follow.objects.create(user=cls.author, following=cls.reader)
+
+    def get_request(self, user, path):
+        request = Request(APIRequestFactory().get(path))
+        request.user = user
+        return request
+
+    def test_recipes(self):
+        for user in (self.reader, AnonymousUser()):
+            with self.subTest(user=user):
+                request = self.get_request(user, '/api/recipes/')
+                representation = RecipeRepresentation(request)
+                recipes = representation.annotate(Recipe.objects.all())
+                self.assertEqual(
+                    representation.to_data(representation.values(recipes)),
+                    RecipelistSerializer(
+                        recipes,
+                        many=True,
+                        context={'request': request},
+                    ).data,
+                )
+
+    def test_subscriptions(self):
+        for user in (self.reader, self.author, AnonymousUser()):
+            for query in ('', '?recipes_limit=2'):
+                with self.subTest(user=user, query=query):
+                    request = self.get_request(
+                        user,
+                        f'/api/users/subscriptions/{query}',
+                    )
+                    representation = SubscriptionRepresentation(request)
+                    users = User.objects.annotate(
+                        recipes_count=Count('recipe'),
+                    )
+                    self.assertEqual(
+                        representation.to_data(representation.values(users)),
+                        SubscriptionsSerializer(
+                            users,
+                            many=True,
+                            context={'request': request},
+                        ).data,
+                    )
+
+
+class ShoppingListExportTest(ApiTestCase):
+    """Задания на формирование pdf, потерянные при перезапуске воркера."""
+    def create_export(self, age):
+        export = ShoppingListExport.objects.create(user=self.reader)
+        ShoppingListExport.objects.filter(pk=export.pk).update(
+            created=timezone.now() - timedelta(seconds=age),
+        )
+        return export
+
+    def get_status(self, export):
+        return self.reader_client.get(
+            f'/api/recipes/download_shopping_cart/{export.pk}/'
+        )
+
+    def test_recent_pending_export(self):
+        response = self.get_status(self.create_export(age=1))
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], ShoppingListExport.PENDING)
+
+    def test_stale_pending_export_fails(self):
+        export = self.create_export(
+            age=settings.PDF_EXPORT_PENDING_TIMEOUT + 1,
+        )
+        response = self.get_status(export)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], ShoppingListExport.FAILED)
+        export.refresh_from_db()
+        self.assertEqual(export.status, ShoppingListExport.FAILED)
+
+    def render(self, export):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(PDF_POOL_WORKERS=0, MEDIA_ROOT=directory):
+                # Задание закрывает соединения потока, а тест идет в одном.
+                with mock.patch('api.tasks.connections'):
+                    tasks.render_export(export.pk, [])
+                export.refresh_from_db()
+                files = [
+                    name
+                    for _, _, names in os.walk(directory)
+                    for name in names
+                ]
+        return files
+
+    def test_render_pending_export(self):
+        export = self.create_export(age=1)
+        self.assertEqual(self.render(export), [f'{export.pk}.pdf'])
+        self.assertEqual(export.status, ShoppingListExport.READY)
+
+    def test_render_keeps_failed_export(self):
+        export = self.create_export(
+            age=settings.PDF_EXPORT_PENDING_TIMEOUT + 1,
+        )
+        tasks.fail_stale_exports()
+        self.assertEqual(self.render(export), [])
+        self.assertEqual(export.status, ShoppingListExport.FAILED)
+        self.assertFalse(export.file)
+
+    @override_settings(PDF_EXPORT_MAX_QUEUED=0)
+    def test_full_queue_rejected(self):
+        response = self.reader_client.post(
+            '/api/recipes/download_shopping_cart/'
+        )
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(ShoppingListExport.objects.exists())
+
+    @override_settings(PDF_EXPORT_MAX_QUEUED=0)
+    def test_queue_filled_before_commit(self):
+        export = self.create_export(age=1)
+        tasks.submit_export(export.pk, [])
+        export.refresh_from_db()
+        self.assertEqual(export.status, ShoppingListExport.FAILED)
+
+
+class CompressionTest(ApiTestCase):
+    """Сжимается JSON API, но не HTML с CSRF-токеном."""
+    def test_json_compressed(self):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {i}', measurement_unit='г')
+            for i in range(3, 100)
+        )
+        response = self.anon_client.get(
+            '/api/ingredients/',
+            HTTP_ACCEPT_ENCODING='gzip',
+        )
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_admin_html_not_compressed(self):
+        response = self.client.get(
+            '/admin/login/',
+            HTTP_ACCEPT_ENCODING='gzip, br',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'csrfmiddlewaretoken', response.content)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+class FastJSONRendererTest(ApiTestCase):
+    """
+    orjson дает тот же JSON, что и JSONRenderer, после разбора:
+    побайтно они расходятся, например, в записи чисел с плавающей точкой.
+    """
+    def assertSameJSON(self, data):
+        fast = FastJSONRenderer().render(data)
+        self.assertEqual(json.loads(fast), json.loads(JSONRenderer().render(data)))
+        return fast
+
+    def test_api_responses(self):
+        Recipe.objects.filter(pk=self.recipes[0].pk).update(
+            calories=1e16,
+            proteins=1e-7,
+            fats=0.1,
+        )
+        Favorite.objects.create(user=self.reader, recipe=self.recipes[0])
+        Follow.objects.create(user=self.reader, following=self.author)
+        for url in (
+            '/api/recipes/',
+            f'/api/recipes/{self.recipes[0].id}/',
+            '/api/recipes/?fields=id,name,calories,author,tags',
+            '/api/ingredients/',
+            '/api/tags/',
+            '/api/users/',
+            '/api/users/subscriptions/',
+        ):
+            with self.subTest(url=url):
+                response = self.reader_client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertSameJSON(response.data)
+        self.assertIn(b'1e16', self.assertSameJSON(
+            self.reader_client.get(f'/api/recipes/{self.recipes[0].id}/').data
+        ))
+
+    def test_fallback_types(self):
+        self.assertSameJSON({
+            'decimal': Decimal('1.50'),
+            'datetime': timezone.now(),
+            'lazy': gettext_lazy('Ленивая строка'),
+            'separators': 'a\u2028b\u2029c',
+            'big': 2 ** 70,
+        })
+
+
+@override_settings(PDF_POOL_WORKERS=1)
+class PDFPoolTest(SimpleTestCase):
+    """Пул процессов для pdf после гибели дочернего процесса."""
+    rows = [{
+        'total_amount': 100,
+        'recipe__ingredients__measurement_unit': 'г',
+        'recipe__ingredients__name': 'Мука',
+    }]
+
+    def tearDown(self):
+        if utils.pdf_pool is not None:
+            utils.pdf_pool.shutdown()
+            utils.pdf_pool = None
+
+    def render(self):
+        return utils.render_pdf_in_pool(self.rows)
+
+    def test_killed_process_replaced(self):
+        self.assertTrue(self.render().startswith(b'%PDF'))
+        pool = utils.pdf_pool
+        for process in list(pool._processes.values()):
+            os.kill(process.pid, signal.SIGKILL)
+        deadline = time.monotonic() + 10
+        while not pool._broken and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertTrue(pool._broken)
+        self.assertTrue(self.render().startswith(b'%PDF'))
+        self.assertIsNot(utils.pdf_pool, pool)
+
+    def test_process_died_during_job(self):
+        future = Future()
+        future.set_exception(BrokenProcessPool())
+        pool = mock.Mock()
+        pool.submit.return_value = future
+        with mock.patch.object(utils, 'pdf_pool', pool):
+            with self.assertRaises(PDFRenderUnavailable):
+                self.render()
+            self.assertIsNone(utils.pdf_pool)
+        pool.shutdown.assert_called_once_with(wait=False)
+
+
+class RecipeWriteQueriesTest(ApiTestCase):
+    """Запросы к БД при изменении рецепта и связей с ним."""
+    image = (
+        'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJ'
+        'AAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=='
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.ingredients += [
+            Ingredient.objects.create(name=f'Ингредиент {i}', measurement_unit='г')
+            for i in range(3, 5)
+        ]
+
+    def get_payload(self, count):
+        return {
+            'tags': [tag.id for tag in self.tags],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': i + 1}
+                for i, ingredient in enumerate(self.ingredients[:count])
+            ],
+            'name': f'Рецепт из {count}',
+            'image': self.image,
+            'text': 'Описание',
+            'cooking_time': 15,
+        }
+
+    def write(self, method, url, count, queries):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(MEDIA_ROOT=directory):
+                with self.assertNumQueries(queries):
+                    response = getattr(self.author_client, method)(
+                        url,
+                        self.get_payload(count),
+                        format='json',
+                    )
+        # Ответ на запись совпадает с последующим чтением, в том числе
+        # отметками пользователя и абсолютной ссылкой на картинку.
+        detail = self.author_client.get(
+            f'/api/recipes/{response.data["id"]}/'
+        )
+        self.assertEqual(response.json(), detail.json())
+        self.assertTrue(
+            response.data['image'].startswith('http://testserver/media/')
+        )
+        return response
+
+    def test_create(self):
+        # Число запросов не зависит от числа ингредиентов.
+        for count in (2, 5):
+            with self.subTest(count=count):
+                response = self.write('post', '/api/recipes/', count, 16)
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(len(response.data['ingredients']), count)
+
+    def test_update(self):
+        recipe = self.recipes[0]
+        Favorite.objects.create(user=self.author, recipe=recipe)
+        for count in (2, 5):
+            with self.subTest(count=count):
+                response = self.write(
+                    'patch',
+                    f'/api/recipes/{recipe.id}/',
+                    count,
+                    16,
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['ingredients']), count)
+                self.assertTrue(response.data['is_favorited'])
+
+    def test_favorite(self):
+        # Рецепт загружается один раз, INSERT - в точке сохранения.
+        with self.assertNumQueries(4):
+            response = self.reader_client.post(
+                f'/api/recipes/{self.recipes[0].id}/favorite/'
+            )
+        self.assertEqual(response.status_code, 201)
+
+    def test_shopping_cart(self):
+        with self.assertNumQueries(4):
+            response = self.reader_client.post(
+                f'/api/recipes/{self.recipes[0].id}/shopping_cart/'
+            )
+        self.assertEqual(response.status_code, 201)
+
+    def test_patch_by_other_user(self):
+        with self.assertNumQueries(1):
+            response = self.reader_client.patch(
+                f'/api/recipes/{self.recipes[0].id}/',
+                {'name': 'Чужой рецепт'},
+                format='json',
+            )
+        self.assertEqual(response.status_code, 403)
+
+    def test_destroy(self):
+        # Рецепт загружается только с id и автором, остальное - каскад.
+        with self.assertNumQueries(9):
+            response = self.author_client.delete(
+                f'/api/recipes/{self.recipes[0].id}/'
+            )
+        self.assertEqual(response.status_code, 204)
+
+
+class FastDeleteInvalidationTest(ApiTestCase):
+    """
+    Удаление строк без post_delete сбрасывает кэш одним вызовом,
+    сколько бы строк ни было удалено.
+    """
+    def get_generations(self, *models):
+        return get_generations([model_namespace(model) for model in models])
+
+    def patch_recipe(self, recipe):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.author_client.patch(
+                f'/api/recipes/{recipe.id}/',
+                {
+                    'tags': [self.tags[0].id],
+                    'ingredients': [
+                        {'id': self.ingredients[0].id, 'amount': 5},
+                    ],
+                    'name': 'Новое название',
+                    'text': 'Новое описание',
+                    'cooking_time': 15,
+                },
+                format='json',
+            )
+        self.assertEqual(response.status_code, 200)
+        return len(callbacks)
+
+    def test_recipe_update(self):
+        recipe = self.recipes[1]
+        for i in range(3, 20):
+            RecipeIngredient.objects.create(
+                recipe=recipe,
+                ingredient=Ingredient.objects.create(
+                    name=f'Ингредиент {i}',
+                    measurement_unit='г',
+                ),
+                amount=1,
+            )
+        self.assertEqual(
+            self.patch_recipe(self.recipes[0]),
+            self.patch_recipe(recipe),
+        )
+
+    def test_meal_plan_clear(self):
+        MealPlan.objects.bulk_create(
+            MealPlan(user=self.reader, recipe=recipe, date=date(2026, 1, 1))
+            for recipe in self.recipes
+        )
+        before = self.get_generations(MealPlan)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.reader_client.delete('/api/meal_plan/clear/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(len(callbacks), 1)
+        self.assertNotEqual(self.get_generations(MealPlan), before)
+
+    def test_admin_delete_selected(self):
+        favorites = [
+            Favorite.objects.create(user=self.reader, recipe=recipe)
+            for recipe in self.recipes
+        ]
+        admin_user = User.objects.create_superuser(
+            email='admin@example.com',
+            username='admin',
+            first_name='Админ',
+            last_name='Админов',
+            password='password',
+        )
+        self.client.force_login(admin_user)
+        namespaces = [
+            model_namespace(Favorite),
+            owner_namespace(self.reader.id),
+        ]
+        before = get_generations(namespaces)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.post(
+                reverse('admin:recipes_favorite_changelist'),
+                {
+                    'action': 'delete_selected',
+                    '_selected_action': [favorite.id for favorite in favorites],
+                    'post': 'yes',
+                },
+            )
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Favorite.objects.exists())
+        self.assertEqual(len(callbacks), 1)
+        after = get_generations(namespaces)
+        self.assertTrue(all(new != old for new, old in zip(after, before)))
+
+    def test_recipe_delete_cascade(self):
+        Favorite.objects.create(user=self.reader, recipe=self.recipes[0])
+        models = (Favorite, ShoppingList, MealPlan, RecipeIngredient)
+        before = self.get_generations(*models)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.author_client.delete(
+                f'/api/recipes/{self.recipes[0].id}/'
+            )
+        self.assertEqual(response.status_code, 204)
+        after = self.get_generations(*models)
+        self.assertTrue(all(new != old for new, old in zip(after, before)))
+
+
+class RecipeCopyTest(ApiTestCase):
+    """Копия рецепта от имени текущего пользователя."""
+    def test_copy(self):
+        source = self.recipes[0]
+        Recipe.objects.filter(pk=source.pk).update(
+            calories=120.5,
+            proteins=3,
+            fats=1.5,
+            carbohydrates=20,
+            cost=42,
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(MEDIA_ROOT=directory):
+                response = self.reader_client.post(
+                    f'/api/recipes/{source.id}/copy/'
+                )
+            self.assertEqual(os.listdir(directory), [])
+        self.assertEqual(response.status_code, 201)
+        copy = Recipe.objects.get(pk=response.data['id'])
+        source.refresh_from_db()
+        self.assertEqual(copy.author, self.reader)
+        self.assertEqual(copy.image.name, source.image.name)
+        for field in (
+            'name',
+            'text',
+            'cooking_time',
+            'ingredients_count',
+            'calories',
+            'proteins',
+            'fats',
+            'carbohydrates',
+            'cost',
+        ):
+            self.assertEqual(getattr(copy, field), getattr(source, field))
+        self.assertEqual(
+            set(copy.tags.values_list('id', flat=True)),
+            set(source.tags.values_list('id', flat=True)),
+        )
+        self.assertEqual(
+            list(copy.recipe.values_list('ingredient_id', 'amount')),
+            list(source.recipe.values_list('ingredient_id', 'amount')),
+        )
+        self.assertEqual(response.data['author']['id'], self.reader.id)
+
+    def test_missing_source(self):
+        for pk in (0, 'abc'):
+            with self.subTest(pk=pk):
+                response = self.reader_client.post(f'/api/recipes/{pk}/copy/')
+                self.assertEqual(response.status_code, 404)
+        self.assertEqual(Recipe.objects.count(), len(self.recipes))
+
+
+class SimilarRecipesTest(ApiTestCase):
+    """Похожие рецепты, предрассчитанные update_similar_recipes."""
+    def create_similar(self, name, ingredients, tag):
+        recipe = Recipe.objects.create(
+            author=self.author,
+            name=name,
+            text='Описание',
+            cooking_time=10,
+            image='recipe/images/test.png',
+        )
+        recipe.tags.set([tag])
+        for ingredient in ingredients:
+            RecipeIngredient.objects.create(
+                recipe=recipe,
+                ingredient=ingredient,
+                amount=1,
+            )
+        return recipe
+
+    def get_similar(self, recipe):
+        response = self.anon_client.get(f'/api/recipes/{recipe.id}/similar/')
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.data]
+
+    def update_similar(self, **options):
+        call_command('update_similar_recipes', stdout=StringIO(), **options)
+
+    def test_ordering_and_incremental_update(self):
+        a, b, c, d, x, y, z, q = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in 'abcdxyzq'
+        )
+        first, second = self.tags
+        base = self.create_similar('База', (a, b, c, d), first)
+        same = self.create_similar('Такой же', (a, b, c, d), first)
+        close = self.create_similar('Близкий', (a, b, c, x), first)
+        far = self.create_similar('Далекий', (a, y, z), second)
+        other = self.create_similar('Другой', (q,), second)
+        self.update_similar(full=True)
+        self.assertEqual(self.get_similar(base), [same.id, close.id, far.id])
+        self.assertEqual(self.get_similar(other), [])
+        untouched = list(
+            RecipeSimilarity.objects.filter(
+                recipe=self.recipes[0],
+            ).values_list('similar_id', 'updated')
+        )
+        self.assertTrue(untouched)
+
+        other.recipe.all().delete()
+        for ingredient in (a, b, c):
+            RecipeIngredient.objects.create(
+                recipe=other,
+                ingredient=ingredient,
+                amount=1,
+            )
+        other.tags.set([first])
+        other.save()
+        self.update_similar()
+        self.assertEqual(
+            self.get_similar(base),
+            [same.id, other.id, close.id, far.id],
+        )
+        # Три рецепта с a, b, c и тем же тегом одинаково похожи.
+        self.assertEqual(
+            set(self.get_similar(other)[:3]),
+            {base.id, same.id, close.id},
+        )
+        self.assertEqual(
+            list(
+                RecipeSimilarity.objects.filter(
+                    recipe=self.recipes[0],
+                ).values_list('similar_id', 'updated')
+            ),
+            untouched,
+        )
+
+    def test_missing_recipe(self):
+        response = self.anon_client.get('/api/recipes/0/similar/')
+        self.assertEqual(response.status_code, 404)
+
+
+class MealPlanTest(ApiTestCase):
+    """План питания и список покупок для него."""
+    path = '/api/meal_plan/'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Ingredient.objects.filter(
+            pk__in=[ingredient.pk for ingredient in cls.ingredients],
+        ).update(price=0.5)
+
+    def plan(self, recipe, day, servings=1):
+        return MealPlan.objects.create(
+            user=self.reader,
+            recipe=recipe,
+            date=date(2026, 1, day),
+            servings=servings,
+        )
+
+    def get_shopping_list(self, query=''):
+        response = self.reader_client.get(
+            f'{self.path}shopping_list/{query}'
+        )
+        self.assertEqual(response.status_code, 200)
+        return {row['ingredient']: row['amount'] for row in response.data}
+
+    def test_bulk_create(self):
+        entries = [
+            {'date': '2026-01-01', 'recipe': recipe.id, 'servings': 2}
+            for recipe in self.recipes
+        ]
+        response = self.reader_client.post(self.path, entries, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            MealPlan.objects.filter(user=self.reader, servings=2).count(),
+            len(self.recipes),
+        )
+
+    def test_bulk_create_missing_recipe(self):
+        entries = [
+            {'date': '2026-01-01', 'recipe': self.recipes[0].id},
+            {'date': '2026-01-02', 'recipe': 0},
+        ]
+        response = self.reader_client.post(self.path, entries, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(MealPlan.objects.exists())
+
+    def test_shopping_list(self):
+        self.plan(self.recipes[0], day=1, servings=2)
+        self.plan(self.recipes[1], day=2, servings=3)
+        self.plan(self.recipes[2], day=10, servings=4)
+        with self.assertNumQueries(1):
+            response = self.reader_client.get(
+                f'{self.path}shopping_list/?start=2026-01-01&end=2026-01-02'
+            )
+        self.assertEqual(response.status_code, 200)
+        # Количество ингредиента i в каждом рецепте - i + 1.
+        self.assertEqual(
+            [
+                (row['ingredient'], row['amount'], row['cost'])
+                for row in response.data
+            ],
+            [
+                (ingredient.id, (i + 1) * 5, (i + 1) * 5 * 0.5)
+                for i, ingredient in enumerate(self.ingredients)
+            ],
+        )
+
+    def test_four_week_plan(self):
+        recipes = [
+            self.create_recipe(self.author, f'План {i}') for i in range(100)
+        ]
+        MealPlan.objects.bulk_create(
+            MealPlan(
+                user=self.reader,
+                recipe=recipe,
+                date=date(2026, 2, i % 28 + 1),
+                servings=i % 4 + 1,
+            )
+            for i, recipe in enumerate(recipes)
+        )
+        servings = sum(i % 4 + 1 for i in range(len(recipes)))
+        with self.assertNumQueries(1):
+            shopping_list = self.get_shopping_list(
+                '?start=2026-02-01&end=2026-02-28'
+            )
+        self.assertEqual(
+            shopping_list,
+            {
+                ingredient.id: (i + 1) * servings
+                for i, ingredient in enumerate(self.ingredients)
+            },
+        )
+
+    def test_clear_range(self):
+        for day in (1, 2, 3, 4):
+            self.plan(self.recipes[0], day=day)
+        response = self.reader_client.delete(
+            f'{self.path}clear/?start=2026-01-02&end=2026-01-03'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(
+            sorted(
+                MealPlan.objects.values_list('date__day', flat=True)
+            ),
+            [1, 4],
+        )
+
+    def test_plan_change_invalidates_shopping_list(self):
+        entry = self.plan(self.recipes[0], day=1)
+        first = self.ingredients[0].id
+        with shared_cache():
+            self.assertEqual(self.get_shopping_list()[first], 1)
+            with self.assertNumQueries(0):
+                self.get_shopping_list()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.reader_client.patch(
+                    f'{self.path}{entry.id}/',
+                    {'servings': 4},
+                    format='json',
+                )
+            self.assertEqual(self.get_shopping_list()[first], 4)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.reader_client.post(
+                    self.path,
+                    [{'date': '2026-01-02', 'recipe': self.recipes[1].id}],
+                    format='json',
+                )
+            self.assertEqual(self.get_shopping_list()[first], 5)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.reader_client.delete(f'{self.path}{entry.id}/')
+            self.assertEqual(self.get_shopping_list()[first], 1)
+
+
+class PopularityTest(ApiTestCase):
+    """Популярность, предрассчитанная update_popularity, и сортировка."""
+    def add(self, model, user, recipe, hours_ago=0):
+        link = model.objects.create(user=user, recipe=recipe)
+        model.objects.filter(pk=link.pk).update(
+            pub_date=timezone.now() - timedelta(hours=hours_ago),
+        )
+        return link
+
+    def update_popularity(self, **options):
+        call_command('update_popularity', stdout=StringIO(), **options)
+
+    def get_scores(self):
+        return {
+            row.recipe: (row.popular, row.trending)
+            for row in RecipePopularity.objects.select_related('recipe')
+        }
+
+    def test_full_and_incremental(self):
+        first, second, third = self.recipes
+        self.add(Favorite, self.reader, first)
+        self.add(ShoppingList, self.reader, first)
+        self.add(Favorite, self.author, second, hours_ago=24)
+        # Вне окна тренда: учитывается только в popular.
+        old = self.add(
+            Favorite,
+            self.reader,
+            third,
+            hours_ago=24 * (settings.TRENDING_DAYS + 1),
+        )
+        self.update_popularity(full=True)
+        scores = self.get_scores()
+        self.assertEqual(scores[first][0], 2)
+        self.assertAlmostEqual(scores[first][1], 2, places=3)
+        self.assertEqual(scores[second][0], 1)
+        self.assertAlmostEqual(scores[second][1], 0.5, places=3)
+        self.assertEqual(scores[third], (1, 0))
+
+        # Новая активность пересчитывается без --full.
+        self.add(ShoppingList, self.author, third)
+        self.update_popularity()
+        self.assertEqual(self.get_scores()[third][0], 2)
+
+        # Удаление у рецепта без тренда подхватывает только --full.
+        old.delete()
+        ShoppingList.objects.filter(recipe=third).update(
+            pub_date=timezone.now() - timedelta(
+                days=settings.TRENDING_DAYS + 1,
+            ),
+        )
+        self.update_popularity(full=True)
+        self.assertEqual(self.get_scores()[third], (1, 0))
+        Favorite.objects.filter(recipe=second).delete()
+        ShoppingList.objects.filter(recipe=third).delete()
+        self.update_popularity()
+        scores = self.get_scores()
+        self.assertEqual(scores[second], (0, 0))
+        self.assertEqual(scores[third], (1, 0))
+        self.update_popularity(full=True)
+        self.assertEqual(self.get_scores()[third], (0, 0))
+
+    def test_ordering_nulls_last(self):
+        first, second, third = self.recipes
+        now = timezone.now()
+        RecipePopularity.objects.bulk_create((
+            RecipePopularity(
+                recipe=first,
+                popular=1,
+                trending=3,
+                updated=now,
+            ),
+            RecipePopularity(
+                recipe=second,
+                popular=5,
+                trending=0.5,
+                updated=now,
+            ),
+        ))
+        for ordering, expected in (
+            ('popular', [second, first, third]),
+            ('trending', [first, second, third]),
+        ):
+            with self.subTest(ordering=ordering):
+                response = self.anon_client.get(
+                    f'/api/recipes/?ordering={ordering}'
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    [row['id'] for row in response.data['results']],
+                    [recipe.id for recipe in expected],
+                )
+
+
+class PaginationCountTest(ApiTestCase):
+    """Число объектов для пагинации."""
+    def test_empty_in_filter(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                get_count(Recipe.objects.filter(pk__in=[])),
+                (0, False),
+            )
+
+    def test_filtered_count(self):
+        self.assertEqual(
+            get_count(Recipe.objects.filter(author=self.author)),
+            (len(self.recipes), False),
+        )
+
+    def test_cached_count_follows_user_writes(self):
+        favorites = Recipe.objects.filter(favorite__user=self.reader)
+        path = f'/api/recipes/{self.recipes[0].id}/favorite/'
+        with shared_cache():
+            self.assertEqual(get_count(favorites), (0, False))
+            with self.assertNumQueries(0):
+                self.assertEqual(get_count(favorites), (0, False))
+            with self.captureOnCommitCallbacks(execute=True):
+                self.reader_client.post(path)
+            self.assertEqual(get_count(favorites), (1, False))
+            with self.captureOnCommitCallbacks(execute=True):
+                self.reader_client.delete(path)
+            self.assertEqual(get_count(favorites), (0, False))
+
+    def test_meal_plan_count_after_clear(self):
+        MealPlan.objects.bulk_create(
+            MealPlan(
+                user=self.reader,
+                recipe=recipe,
+                date=date(2026, 1, day),
+            )
+            for day, recipe in enumerate(self.recipes, start=1)
+        )
+        with shared_cache():
+            response = self.reader_client.get('/api/meal_plan/')
+            self.assertEqual(response.data['count'], len(self.recipes))
+            with self.captureOnCommitCallbacks(execute=True):
+                self.reader_client.delete(
+                    '/api/meal_plan/clear/?start=2026-01-02',
+                )
+            response = self.reader_client.get('/api/meal_plan/')
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(len(response.data['results']), 1)
+
+
+class CachedActionTest(ApiTestCase):
+    """Кэширование ответов с поколениями пространств моделей."""
+    def get_tags(self, queries):
+        with self.assertNumQueries(queries):
+            response = self.anon_client.get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+        return [tag['slug'] for tag in response.data]
+
+    def test_local_memory_cache_not_used(self):
+        self.get_tags(queries=1)
+        self.get_tags(queries=1)
+
+    def test_shared_cache_invalidated_on_write(self):
+        with shared_cache():
+            self.get_tags(queries=1)
+            self.get_tags(queries=0)
+            with self.captureOnCommitCallbacks(execute=True):
+                Tag.objects.create(name='Новый', color='#ffffff', slug='new')
+            self.assertIn('new', self.get_tags(queries=1))
+
+
+@override_settings(PDF_POOL_WORKERS=0)
+class TokenBucketThrottleTest(ApiTestCase):
+    """Ограничение частоты запросов по стоимости в кэше в памяти процесса."""
+    rates = {'user': '40/min', 'anon': '10/min'}
+
+    def setUp(self):
+        super().setUp()
+        self.now = 1000.0
+        for patcher in (
+            mock.patch.object(TokenBucketThrottle, 'THROTTLE_RATES', self.rates),
+            mock.patch.object(
+                TokenBucketThrottle,
+                'timer',
+                lambda throttle: self.now,
+            ),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def download(self):
+        return self.reader_client.get('/api/recipes/download_shopping_cart/')
+
+    def test_pdf_cost_and_refill(self):
+        cost = RecipeViewSet.throttle_costs['download_shopping_cart']
+        for _ in range(40 // cost):
+            self.assertEqual(self.download().status_code, 200)
+        response = self.download()
+        self.assertEqual(response.status_code, 429)
+        retry_after = int(response['Retry-After'])
+        self.assertEqual(retry_after, cost * 60 // 40)
+        self.now += retry_after - 1
+        self.assertEqual(self.download().status_code, 429)
+        self.now += 1
+        self.assertEqual(self.download().status_code, 200)
+
+    def test_offset_cost(self):
+        offset = settings.THROTTLE_OFFSET_COST_STEP * 5
+        path = f'/api/recipes/?offset={offset}'
+        self.assertEqual(self.anon_client.get(path).status_code, 200)
+        self.assertEqual(self.anon_client.get(path).status_code, 429)
+        self.assertEqual(self.anon_client.get('/api/recipes/').status_code, 200)
+
+    def test_anonymous_clients_by_forwarded_address(self):
+        for _ in range(10):
+            self.anon_client.get('/api/tags/', HTTP_X_FORWARDED_FOR='1.1.1.1')
+        response = self.anon_client.get(
+            '/api/tags/',
+            HTTP_X_FORWARDED_FOR='1.1.1.1',
+        )
+        self.assertEqual(response.status_code, 429)
+        response = self.anon_client.get(
+            '/api/tags/',
+            HTTP_X_FORWARDED_FOR='2.2.2.2',
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+@skipUnless(
+    settings.REPLICA_DATABASE in settings.DATABASES,
+    'Реплика не настроена (DB_REPLICA_HOST).',
+)
+class ReplicaRoutingTest(TransactionTestCase):
+    """Чтение с реплики и закрепление клиента за основной БД после записи."""
+    # Все настроенные БД: основная и реплика, если она задана.
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='user@example.com',
+            username='user',
+            first_name='Пользователь',
+            last_name='Пользователь',
+            password='password',
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.user,
+            name='Рецепт',
+            text='Описание',
+            cooking_time=10,
+            image='recipe/images/test.png',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_with_queries(self, path):
+        with CaptureQueriesContext(connections['default']) as primary:
+            with CaptureQueriesContext(
+                connections[settings.REPLICA_DATABASE],
+            ) as replica:
+                response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return len(primary), len(replica)
+
+    def test_get_reads_from_replica(self):
+        primary, replica = self.get_with_queries('/api/recipes/')
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_write_pins_rest_of_request(self):
+        use_replica(True)
+        try:
+            with CaptureQueriesContext(
+                connections[settings.REPLICA_DATABASE],
+            ) as replica:
+                Tag.objects.count()
+                Tag.objects.create(name='Тег', color='#000000', slug='tag')
+                Tag.objects.count()
+        finally:
+            use_replica(False)
+        self.assertEqual(len(replica), 1)
+
+    def test_write_sets_pin_cookie_for_next_request(self):
+        response = self.client.post(
+            f'/api/recipes/{self.recipe.id}/favorite/'
+        )
+        self.assertEqual(response.status_code, 201)
+        cookie = response.cookies[settings.REPLICA_PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_PIN_SECONDS)
+        primary, replica = self.get_with_queries('/api/recipes/')
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def get_cache_timeout(self, path):
+        """Таймаут, с которым закэширован ответ на GET path."""
+        with shared_cache():
+            with mock.patch(
+                'api.caching.cache',
+                mock.Mock(wraps=caches['default']),
+            ) as cache_mock:
+                self.get_with_queries(path)
+        (key, _, timeout), _ = cache_mock.set.call_args
+        self.assertTrue(key.startswith('view:'))
+        return timeout
+
+    def test_replica_reads_cached_no_longer_than_lag(self):
+        self.assertEqual(
+            self.get_cache_timeout('/api/recipes/'),
+            settings.REPLICA_PIN_SECONDS,
+        )
+        self.client.cookies[settings.REPLICA_PIN_COOKIE] = '1'
+        self.assertEqual(
+            self.get_cache_timeout('/api/recipes/'),
+            settings.VIEW_CACHE_TIMEOUT,
+        )
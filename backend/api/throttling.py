@@ -0,0 +1,61 @@
+from django.conf import settings
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    Ограничение запросов по алгоритму token bucket.
+    Емкость корзины и скорость ее пополнения задаются частотой из
+    DEFAULT_THROTTLE_RATES для scope 'user' или 'anon'. Запрос списывает
+    из корзины свою стоимость: по умолчанию 1, для действий из атрибута
+    представления throttle_costs - указанную там. Для списков стоимость
+    растет с параметром offset. Состояние корзины хранится в кэше Django.
+    """
+    cache_format = 'throttle_bucket_%(scope)s_%(ident)s'
+
+    def __init__(self):
+        self.wait_time = None
+
+    def get_cache_key(self, request, view):
+        if request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+    def get_cost(self, request, view):
+        action = getattr(view, 'action', None)
+        cost = getattr(view, 'throttle_costs', {}).get(action, 1)
+        if action == 'list':
+            try:
+                offset = int(request.query_params.get('offset', 0))
+            except ValueError:
+                offset = 0
+            cost += max(offset, 0) // settings.THROTTLE_OFFSET_COST_STEP
+        return cost
+
+    def allow_request(self, request, view):
+        self.scope = 'user' if request.user.is_authenticated else 'anon'
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        if self.rate is None:
+            return True
+        key = self.get_cache_key(request, view)
+        cost = min(self.get_cost(request, view), self.num_requests)
+        refill_rate = self.num_requests / self.duration
+        now = self.timer()
+        tokens, updated = self.cache.get(key, (self.num_requests, now))
+        tokens = min(
+            self.num_requests,
+            tokens + (now - updated) * refill_rate,
+        )
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        else:
+            self.wait_time = (cost - tokens) / refill_rate
+        self.cache.set(key, (tokens, now), self.duration)
+        return allowed
+
+    def wait(self):
+        return self.wait_time
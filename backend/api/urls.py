@@ -8,6 +8,7 @@ from .views import (
     IngredientViewSet,
     RecipeViewSet,
     UserViewSet,
+    MealPlanViewSet,
 )
 
 router_v1 = routers.DefaultRouter()
@@ -15,6 +16,7 @@ router_v1.register(r'tags', TagViewSet, basename='tags')
 router_v1.register(r'ingredients', IngredientViewSet, basename='ingredients')
 router_v1.register(r'recipes', RecipeViewSet, basename='recipes')
 router_v1.register(r'users', UserViewSet, basename='users')
+router_v1.register(r'meal_plan', MealPlanViewSet, basename='meal_plan')
 
 
 urlpatterns = [
@@ -1,14 +1,58 @@
+import io
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
 from django.conf import settings
-from django.http import HttpResponse
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfgen import canvas
 
+from .exceptions import PDFRenderUnavailable
 
-def get_pdf(ingredient_list):
-    """Создает и заполняет pdf file."""
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = 'attachment; filename="file.pdf"'
+pdf_pool = None
+pdf_pool_lock = threading.Lock()
+pdf_pool_slots = threading.BoundedSemaphore(settings.PDF_POOL_MAX_PENDING)
+
+
+def get_query_list(request, param):
+    """
+    Возвращает множество значений параметра запроса через запятую
+    или None, если параметр не передан.
+    """
+    if request is None or param not in request.query_params:
+        return None
+    return {
+        value.strip()
+        for value in request.query_params[param].split(',')
+        if value.strip()
+    }
+
+
+def get_protected_file_response(name, filename, content_type):
+    """
+    Отдает файл из MEDIA_ROOT после проверки доступа во view.
+    При USE_X_ACCEL_REDIRECT файл отдает nginx из internal location.
+    """
+    if settings.USE_X_ACCEL_REDIRECT:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = f'{settings.PROTECTED_MEDIA_URL}{name}'
+    else:
+        response = FileResponse(
+            default_storage.open(name, 'rb'),
+            content_type=content_type,
+        )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def register_font():
+    """Регистрирует шрифт для pdf один раз на процесс."""
+    if 'Times' in pdfmetrics.getRegisteredFontNames():
+        return
     pdfmetrics.registerFont(
         TTFont(
             'Times',
@@ -16,23 +60,138 @@ def get_pdf(ingredient_list):
             'UTF-8',
         )
     )
-    p = canvas.Canvas(response)
+
+
+def render_pdf(ingredient_list):
+    """Создает pdf file со списком ингредиентов и возвращает его байты."""
+    register_font()
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer)
     p.setFont('Times', settings.FONT)
     p.drawString(
         settings.STRING_TITLE_X,
         settings.STRING_TITLE_Y,
         'Список Ингредиентов.',
     )
-    y = settings.STRING_CONTENT_Y
+    lines = []
+    total_cost = None
     for ingredient in ingredient_list:
-        p.drawString(
-            settings.STRING_CONTENT_X,
-            y,
+        line = (
             f"{ingredient['total_amount']} "
             f"{ingredient['recipe__ingredients__measurement_unit']}.  "
-            f"{ingredient['recipe__ingredients__name']};",
+            f"{ingredient['recipe__ingredients__name']};"
         )
+        cost = ingredient.get('total_cost')
+        if cost is not None:
+            line += f' ~{cost:.2f} руб.'
+            total_cost = (total_cost or 0) + cost
+        lines.append(line)
+    if total_cost is not None:
+        lines.append(f'Примерная стоимость: {total_cost:.2f} руб.')
+    y = settings.STRING_CONTENT_Y
+    for line in lines:
+        if y < settings.LINE_OFFSET_CONTENT:
+            p.showPage()
+            p.setFont('Times', settings.FONT)
+            y = settings.STRING_TITLE_Y
+        p.drawString(settings.STRING_CONTENT_X, y, line)
         y -= settings.LINE_OFFSET_CONTENT
     p.showPage()
     p.save()
+    return buffer.getvalue()
+
+
+def get_pdf_pool():
+    """
+    Возвращает общий на процесс пул процессов для формирования pdf.
+    ReportLab держит GIL, поэтому рендеринг вынесен из потоков воркера.
+    """
+    global pdf_pool
+    with pdf_pool_lock:
+        if pdf_pool is None:
+            pdf_pool = ProcessPoolExecutor(
+                max_workers=settings.PDF_POOL_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=register_font,
+            )
+    return pdf_pool
+
+
+def reset_pdf_pool(pool):
+    """
+    Убирает пул, в котором умер процесс (OOM, segfault): такой пул
+    отклоняет все задания. Следующий вызов get_pdf_pool создаст новый.
+    """
+    global pdf_pool
+    with pdf_pool_lock:
+        if pdf_pool is pool:
+            pdf_pool = None
+    pool.shutdown(wait=False)
+
+
+def submit_pdf(rows):
+    """
+    Ставит задание в пул и возвращает пул и future. Если пул сломан
+    процессом, упавшим на прошлом задании, задание один раз
+    повторяется в новом пуле.
+    """
+    pool = get_pdf_pool()
+    try:
+        return pool, pool.submit(render_pdf, rows)
+    except BrokenProcessPool:
+        reset_pdf_pool(pool)
+    pool = get_pdf_pool()
+    try:
+        return pool, pool.submit(render_pdf, rows)
+    except BrokenProcessPool:
+        reset_pdf_pool(pool)
+        raise
+
+
+def render_pdf_in_pool(ingredient_list, wait=False):
+    """
+    Формирует pdf в пуле процессов. В пул передаются только строки
+    списка ингредиентов, обратно возвращаются байты файла.
+    Число заданий в пуле ограничено PDF_POOL_MAX_PENDING: при
+    переполнении запрос сразу получает 503, а при wait=True ждет
+    свободного места не дольше PDF_RENDER_TIMEOUT. Если процесс пула
+    умер во время задания, пул пересоздается, а запрос получает 503.
+    """
+    rows = [dict(row) for row in ingredient_list]
+    if not settings.PDF_POOL_WORKERS:
+        return render_pdf(rows)
+    if wait:
+        acquired = pdf_pool_slots.acquire(timeout=settings.PDF_RENDER_TIMEOUT)
+    else:
+        acquired = pdf_pool_slots.acquire(blocking=False)
+    if not acquired:
+        raise PDFRenderUnavailable
+    try:
+        pool, future = submit_pdf(rows)
+    except BrokenProcessPool:
+        pdf_pool_slots.release()
+        raise PDFRenderUnavailable
+    except Exception:
+        pdf_pool_slots.release()
+        raise
+    # Место освобождается, когда задание завершено или отменено:
+    # cancel() не останавливает уже запущенное задание.
+    future.add_done_callback(lambda future: pdf_pool_slots.release())
+    try:
+        return future.result(timeout=settings.PDF_RENDER_TIMEOUT)
+    except TimeoutError:
+        future.cancel()
+        raise PDFRenderUnavailable
+    except BrokenProcessPool:
+        reset_pdf_pool(pool)
+        raise PDFRenderUnavailable
+
+
+def get_pdf(ingredient_list):
+    """Возвращает ответ с pdf file списка ингредиентов."""
+    response = HttpResponse(
+        render_pdf_in_pool(ingredient_list),
+        content_type='application/pdf',
+    )
+    response['Content-Disposition'] = 'attachment; filename="file.pdf"'
     return response
@@ -1,28 +1,43 @@
 from djoser.views import UserViewSet as DjoserUserViewSet
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Prefetch
 from django.db.models.aggregates import Sum
 from django_filters.rest_framework import DjangoFilterBackend
 from django.core.exceptions import ObjectDoesNotExist
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control, patch_vary_headers
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import (
     IsAuthenticatedOrReadOnly,
     IsAuthenticated,
 )
-from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.response import Response
 
 from recipes.models import (
     Tag,
     Ingredient,
     Recipe,
+    RecipeIngredient,
     ShoppingList,
+    ShoppingListExport,
     Favorite,
     User,
     Follow,
+    MealPlan,
 )
-from .filters import IngredientFilter, RecipeFilter
+from .caching import (
+    bump,
+    cached_action,
+    invalidate_deleted,
+    model_namespace,
+)
+from .filters import IngredientFilter, MealPlanFilter, RecipeFilter
+from .pagination import EstimatedLimitOffsetPagination, FeedPagination
 from .permissions import IsAuthor
+from .representations import RecipeRepresentation, SubscriptionRepresentation
 from .serializers import (
     TagSerializer,
     IngredientSerializer,
@@ -34,8 +49,14 @@ from .serializers import (
     UserSerializer,
     FollowSerializer,
     SubscriptionsSerializer,
+    ShoppingListExportSerializer,
+    MealPlanSerializer,
 )
-from .utils import get_pdf
+from .tasks import enqueue_export, fail_stale_exports
+from .utils import get_pdf, get_protected_file_response, get_query_list
+
+# Модели, от которых зависят закэшированные ответы о рецептах.
+RECIPE_CACHE_MODELS = (Recipe, RecipeIngredient, Tag, Ingredient, User)
 
 
 class UserViewSet(DjoserUserViewSet):
@@ -44,6 +65,22 @@ class UserViewSet(DjoserUserViewSet):
     serializer_class = UserSerializer
     http_method_names = ['get', 'post', 'delete', 'patch']
 
+    def finalize_response(self, request, response, *args, **kwargs):
+        """
+        Ответы на GET зависят от токена (is_subscribed), поэтому клиент
+        должен перепроверять их по ETag, а общие кэши не смешивать.
+        """
+        response = super().finalize_response(
+            request,
+            response,
+            *args,
+            **kwargs,
+        )
+        if request.method == 'GET':
+            patch_vary_headers(response, ('Authorization',))
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
     @action(
         ['GET'],
         detail=False,
@@ -51,7 +88,10 @@ class UserViewSet(DjoserUserViewSet):
     )
     def me(self, request):
         """Отображает информацию о себе."""
-        serializer = UserSerializer(request.user)
+        serializer = UserSerializer(
+            request.user,
+            context=self.get_serializer_context(),
+        )
         return Response(data=serializer.data)
 
     @action(
@@ -61,8 +101,8 @@ class UserViewSet(DjoserUserViewSet):
     )
     def subscribe(serf, request, id):
         """Добавление и удаление из подписок."""
-        following = get_object_or_404(User, id=id)
         if request.method == 'POST':
+            following = get_object_or_404(User, id=id)
             serializer = FollowSerializer(
                 data={'user': request.user.id, 'following': following.id}
             )
@@ -76,28 +116,45 @@ class UserViewSet(DjoserUserViewSet):
                 data=subscriptions_info.data,
                 status=status.HTTP_201_CREATED,
             )
-        try:
-            follow = Follow.objects.get(user=request.user, following=following)
-        except ObjectDoesNotExist:
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-        follow.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        deleted, _ = Follow.objects.filter(
+            user=request.user,
+            following_id=id,
+        ).delete()
+        if deleted:
+            invalidate_deleted(Follow, [request.user.id])
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        if not User.objects.filter(id=id).exists():
+            raise Http404
+        return Response(status=status.HTTP_400_BAD_REQUEST)
 
     @action(
         ['GET'],
         detail=False,
     )
+    @cached_action(models=(Recipe, User), per_user=True)
     def subscriptions(self, request):
         """Отображение списка подсписок."""
         subscriptions = User.objects.filter(
             following__user=request.user.id
         )
+        fields = get_query_list(request, 'fields')
+        if fields is None or 'recipes_count' in fields:
+            subscriptions = subscriptions.annotate(
+                recipes_count=Count('recipe'),
+            )
+        if fields is None:
+            representation = SubscriptionRepresentation(request)
+            subscriptions = representation.values(subscriptions)
         limit = self.request.GET.get('limit')
         if limit is not None:
-            subscriptions = User.objects.filter(
-                following__user=request.user.id
-            )[:int(limit)]
+            subscriptions = subscriptions[:int(limit)]
         page = self.paginate_queryset(subscriptions)
+        if fields is None:
+            if page is not None:
+                return self.get_paginated_response(
+                    representation.to_data(page)
+                )
+            return Response(representation.to_data(subscriptions))
         if page is not None:
             serializer = SubscriptionsSerializer(
                 page,
@@ -119,6 +176,14 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = TagSerializer
     pagination_class = None
 
+    @cached_action(models=(Tag,))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cached_action(models=(Tag,))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet для модели Ingredient."""
@@ -129,36 +194,165 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_class = IngredientFilter
     search_fields = ('name',)
 
+    @cached_action(models=(Ingredient,))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cached_action(models=(Ingredient,))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class RecipeViewSet(viewsets.ModelViewSet):
     """ViewSet для модели Recipe."""
-    queryset = Recipe.objects.all()
+    queryset = Recipe.objects.defer('search_vector')
     http_method_names = ['get', 'post', 'delete', 'patch']
     permission_classes = (IsAuthenticatedOrReadOnly, IsAuthor)
-    pagination_class = LimitOffsetPagination
+    pagination_class = EstimatedLimitOffsetPagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    throttle_costs = {'download_shopping_cart': 20}
 
     def perform_create(self, serializer):
         """Создаем рецепт.Присваеваем текущего пользователя."""
         serializer.save(author=self.request.user)
 
+    def get_queryset(self):
+        """
+        Для чтения подгружает связанные объекты и отметки пользователя
+        только для полей, запрошенных в параметре fields.
+        Без fields связанные объекты загружает RecipeRepresentation.
+        """
+        queryset = super().get_queryset()
+        if self.action == 'destroy':
+            return queryset.only('id', 'author_id')
+        if self.action not in ('list', 'retrieve'):
+            return queryset
+        fields = get_query_list(self.request, 'fields')
+        expand = get_query_list(self.request, 'expand') or set()
+
+        def requested(name):
+            return fields is None or name in fields
+
+        if fields is not None:
+            if 'author' in fields and 'author' in expand:
+                queryset = queryset.select_related('author')
+            if 'tags' in fields:
+                queryset = queryset.prefetch_related('tags')
+            if 'ingredients' in fields:
+                queryset = queryset.prefetch_related(
+                    Prefetch(
+                        'recipe',
+                        queryset=RecipeIngredient.objects.select_related(
+                            'ingredient',
+                        ),
+                    )
+                )
+            if 'text' not in fields:
+                queryset = queryset.defer('text')
+        return RecipeRepresentation(self.request).annotate(
+            queryset,
+            [
+                flag for flag, name in (
+                    ('favorited', 'is_favorited'),
+                    ('in_shopping_cart', 'is_in_shopping_cart'),
+                )
+                if requested(name)
+            ],
+        )
+
+    def filter_queryset(self, queryset):
+        """
+        Фильтры применяются только к чтению: при изменении и удалении
+        рецепт ищется по pk без лишних запросов фильтров.
+        """
+        if self.action not in ('list', 'retrieve'):
+            return queryset
+        return super().filter_queryset(queryset)
+
     def get_serializer_class(self):
         """Выбор сериализатора для разных запросов."""
-        if self.action == 'list':
+        if self.action in ('list', 'retrieve'):
             return RecipelistSerializer
         return RecipeSerializer
 
+    @cached_action(models=RECIPE_CACHE_MODELS, per_user=True)
+    def list(self, request, *args, **kwargs):
+        if get_query_list(request, 'fields') is not None:
+            return super().list(request, *args, **kwargs)
+        representation = RecipeRepresentation(request)
+        recipes = representation.values(
+            self.filter_queryset(self.get_queryset())
+        )
+        page = self.paginate_queryset(recipes)
+        if page is not None:
+            return self.get_paginated_response(representation.to_data(page))
+        return Response(representation.to_data(recipes))
+
+    def get_recipe_data(self, queryset, pk):
+        """
+        Данные одного рецепта тем же набором запросов, что и для списка:
+        строка рецепта с отметками пользователя, теги, ингредиенты
+        и подписка на автора.
+        """
+        representation = RecipeRepresentation(self.request)
+        try:
+            data = representation.to_data(
+                representation.values(
+                    representation.annotate(queryset.filter(pk=pk)),
+                )
+            )
+        except (TypeError, ValueError):
+            raise Http404
+        if not data:
+            raise Http404
+        return data[0]
+
+    @cached_action(models=RECIPE_CACHE_MODELS, per_user=True)
+    def retrieve(self, request, *args, **kwargs):
+        if get_query_list(request, 'fields') is not None:
+            return super().retrieve(request, *args, **kwargs)
+        return Response(
+            self.get_recipe_data(
+                self.filter_queryset(self.get_queryset()),
+                kwargs['pk'],
+            )
+        )
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        return Response(
+            self.get_recipe_data(Recipe.objects, serializer.instance.pk),
+            status=status.HTTP_201_CREATED,
+        )
+
+    def update(self, request, *args, **kwargs):
+        instance = self.get_object()
+        serializer = self.get_serializer(
+            instance,
+            data=request.data,
+            partial=kwargs.pop('partial', False),
+        )
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        return Response(self.get_recipe_data(Recipe.objects, instance.pk))
+
     def add_obj(self, serializer_class, request, pk):
+        """
+        Рецепт загружается один раз и только с полями для ответа,
+        пользователь и рецепт передаются в save() готовыми объектами.
+        """
         try:
-            recipe = Recipe.objects.get(pk=pk)
-        except ObjectDoesNotExist:
+            recipe = Recipe.objects.only(
+                *RecipeInfoSerializer.Meta.fields,
+            ).get(pk=pk)
+        except (ObjectDoesNotExist, ValueError):
             return Response(status=status.HTTP_400_BAD_REQUEST)
-        serializer = serializer_class(
-            data={'user': request.user.id, 'recipe': recipe.id}
-        )
+        serializer = serializer_class(data={})
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        serializer.save(user=request.user, recipe=recipe)
         recipe_serializer = RecipeInfoSerializer(recipe)
         return Response(
             data=recipe_serializer.data,
@@ -166,13 +360,17 @@ class RecipeViewSet(viewsets.ModelViewSet):
         )
 
     def remove_obj(self, model, request, pk):
-        recipe = get_object_or_404(Recipe, pk=pk)
-        try:
-            item = model.objects.get(user=request.user, **{'recipe': recipe})
-        except ObjectDoesNotExist:
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-        item.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        deleted, _ = model.objects.filter(
+            user=request.user,
+            recipe_id=pk,
+        ).delete()
+        if deleted:
+            # Быстрое удаление не отправляет post_delete.
+            invalidate_deleted(model, [request.user.id])
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        if not Recipe.objects.filter(pk=pk).exists():
+            raise Http404
+        return Response(status=status.HTTP_400_BAD_REQUEST)
 
     @action(
         ['POST', 'DELETE'],
@@ -194,18 +392,237 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return self.add_obj(FavoriteSerializer, request, pk)
         return self.remove_obj(Favorite, request, pk)
 
+    @action(
+        ['POST'],
+        detail=True,
+        permission_classes=[IsAuthenticated],
+    )
+    def copy(self, request, pk):
+        """
+        Копия рецепта от имени текущего пользователя. Теги и ингредиенты
+        копируются пачкой, файл картинки используется тот же.
+        """
+        try:
+            source = Recipe.objects.filter(pk=pk).values(
+                'name',
+                'text',
+                'cooking_time',
+                'image',
+                'ingredients_count',
+                'calories',
+                'proteins',
+                'fats',
+                'carbohydrates',
+                'cost',
+            ).first()
+        except ValueError:
+            source = None
+        if source is None:
+            raise Http404
+        with transaction.atomic():
+            recipe = Recipe.objects.create(author=request.user, **source)
+            Recipe.tags.through.objects.bulk_create(
+                Recipe.tags.through(recipe_id=recipe.id, tag_id=tag_id)
+                for tag_id in Recipe.tags.through.objects.filter(
+                    recipe_id=pk,
+                ).values_list('tag_id', flat=True)
+            )
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe_id=recipe.id,
+                    ingredient_id=ingredient_id,
+                    amount=amount,
+                )
+                for ingredient_id, amount in RecipeIngredient.objects.filter(
+                    recipe_id=pk,
+                ).order_by('id').values_list('ingredient_id', 'amount')
+            )
+            # bulk_create не отправляет сигналы.
+            bump(
+                model_namespace(Recipe),
+                model_namespace(RecipeIngredient),
+            )
+        return Response(
+            self.get_recipe_data(Recipe.objects, recipe.pk),
+            status=status.HTTP_201_CREATED,
+        )
+
     @action(
         ['GET'],
+        detail=True,
+    )
+    def similar(self, request, pk):
+        """
+        Похожие рецепты по общим ингредиентам и тегам.
+        Список предрассчитывается командой update_similar_recipes.
+        """
+        try:
+            recipes = list(
+                Recipe.objects.filter(
+                    similar_to__recipe_id=pk,
+                ).order_by('-similar_to__score').only(
+                    *RecipeInfoSerializer.Meta.fields,
+                )[:settings.SIMILAR_RECIPES_LIMIT]
+            )
+        except ValueError:
+            raise Http404
+        if not recipes and not Recipe.objects.filter(pk=pk).exists():
+            raise Http404
+        serializer = RecipeInfoSerializer(
+            recipes,
+            many=True,
+            context=self.get_serializer_context(),
+        )
+        return Response(serializer.data)
+
+    @action(
+        ['GET'],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        pagination_class=FeedPagination,
+    )
+    @cached_action(
+        models=RECIPE_CACHE_MODELS,
+        per_user=True,
+        timeout=settings.FEED_CACHE_TIMEOUT,
+    )
+    def feed(self, request):
+        """Лента рецептов авторов, на которых подписан пользователь."""
+        representation = RecipeRepresentation(request)
+        recipes = representation.annotate(
+            Recipe.objects.filter(
+                author__in=Follow.objects.filter(
+                    user=request.user,
+                ).values('following'),
+            )
+        )
+        page = self.paginate_queryset(representation.values(recipes))
+        return self.get_paginated_response(representation.to_data(page))
+
+    @action(
+        ['GET', 'POST'],
         detail=False,
+        permission_classes=[IsAuthenticated],
     )
     def download_shopping_cart(self, request):
-        """Загрузка ингрединетов из списка покупок в виде pdf."""
+        """
+        Загрузка ингрединетов из списка покупок в виде pdf.
+        POST ставит формирование pdf в очередь и возвращает задание.
+        """
         ingredient_list = ShoppingList.objects.filter(
             user=request.user
         ).values(
             'recipe__ingredients__name',
             'recipe__ingredients__measurement_unit',
         ).annotate(
-            total_amount=Sum('recipe__recipe__amount')
+            total_amount=Sum('recipe__recipe__amount'),
+            total_cost=Sum(
+                F('recipe__recipe__amount') * F('recipe__ingredients__price'),
+                output_field=FloatField(),
+            ),
         ).order_by('recipe__ingredients__name')
-        return get_pdf(ingredient_list)
+        if request.method == 'GET':
+            return get_pdf(ingredient_list)
+        export = enqueue_export(request.user, ingredient_list)
+        return Response(
+            data=ShoppingListExportSerializer(export).data,
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+    @action(
+        ['GET'],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        url_path=r'download_shopping_cart/(?P<export_id>[0-9a-f-]{36})',
+        url_name='download_shopping_cart_export',
+    )
+    def download_shopping_cart_export(self, request, export_id):
+        """Статус задания на формирование pdf или готовый файл."""
+        export = get_object_or_404(
+            ShoppingListExport,
+            pk=export_id,
+            user=request.user,
+        )
+        if export.status == ShoppingListExport.PENDING and fail_stale_exports(
+            ShoppingListExport.objects.filter(pk=export.pk),
+        ):
+            export.status = ShoppingListExport.FAILED
+        if export.status == ShoppingListExport.READY:
+            return get_protected_file_response(
+                export.file.name,
+                'file.pdf',
+                'application/pdf',
+            )
+        return Response(
+            data=ShoppingListExportSerializer(export).data,
+            status=(
+                status.HTTP_202_ACCEPTED
+                if export.status == ShoppingListExport.PENDING
+                else status.HTTP_200_OK
+            ),
+        )
+
+
+class MealPlanViewSet(viewsets.ModelViewSet):
+    """
+    ViewSet для плана питания текущего пользователя.
+    POST принимает одну запись или список записей.
+    """
+    serializer_class = MealPlanSerializer
+    http_method_names = ['get', 'post', 'delete', 'patch']
+    permission_classes = (IsAuthenticated,)
+    filter_backends = (DjangoFilterBackend,)
+    filterset_class = MealPlanFilter
+
+    def get_queryset(self):
+        return MealPlan.objects.filter(user=self.request.user)
+
+    def get_serializer(self, *args, **kwargs):
+        if isinstance(kwargs.get('data'), list):
+            kwargs['many'] = True
+        return super().get_serializer(*args, **kwargs)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        invalidate_deleted(MealPlan, [self.request.user.id])
+
+    @action(
+        ['DELETE'],
+        detail=False,
+    )
+    def clear(self, request):
+        """
+        Удаление записей плана за период start - end одним DELETE
+        и одним сбросом кэша.
+        """
+        if self.filter_queryset(self.get_queryset()).delete()[0]:
+            invalidate_deleted(MealPlan, [request.user.id])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(
+        ['GET'],
+        detail=False,
+    )
+    @cached_action(models=(RecipeIngredient, Ingredient), per_user=True)
+    def shopping_list(self, request):
+        """
+        Список покупок для плана за период start - end одним запросом:
+        количество ингредиента в рецепте умножается на число порций.
+        Кэшируется до изменения плана пользователя или рецептов.
+        """
+        amount = F('recipe__recipe__amount') * F('servings')
+        ingredient_list = self.filter_queryset(self.get_queryset()).values(
+            ingredient=F('recipe__recipe__ingredient_id'),
+            name=F('recipe__recipe__ingredient__name'),
+            measurement_unit=F('recipe__recipe__ingredient__measurement_unit'),
+        ).annotate(
+            amount=Sum(amount),
+            cost=Sum(
+                amount * F('recipe__recipe__ingredient__price'),
+                output_field=FloatField(),
+            ),
+        ).order_by('name')
+        return Response(list(ingredient_list))
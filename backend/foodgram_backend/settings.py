@@ -35,6 +35,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.ReplicaMiddleware',
+    'api.middleware.CompressionMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -77,6 +80,25 @@ DATABASES = {
     }
 }
 
+# Optional read replica: GET and HEAD requests read from it,
+# see api.db_routers.ReplicaRouter and api.middleware.ReplicaMiddleware.
+# REPLICA_PIN_SECONDS bounds the expected replica lag: clients read from the
+# primary for that long after a write, cached replica reads live no longer.
+
+REPLICA_DATABASE = 'replica'
+REPLICA_PIN_COOKIE = 'use_primary_db'
+REPLICA_PIN_SECONDS = 5
+
+if os.getenv('DB_REPLICA_HOST'):
+    DATABASES[REPLICA_DATABASE] = {
+        **DATABASES['default'],
+        'HOST': os.getenv('DB_REPLICA_HOST'),
+        'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['api.db_routers.ReplicaRouter']
+
 
 # Password validation
 
@@ -114,6 +136,8 @@ COOKING_TIME_MIN = 1
 COOKING_TIME_MAX = 32000
 AMOUNT_MIN = 1
 AMOUNT_MAX = 32000
+SERVINGS_MIN = 1
+SERVINGS_MAX = 100
 
 # PDF setting
 
@@ -123,6 +147,73 @@ STRING_TITLE_Y = 800
 STRING_CONTENT_X = 50
 STRING_CONTENT_Y = 750
 LINE_OFFSET_CONTENT = 25
+PDF_EXPORT_WORKERS = 2
+# Export jobs queued or running per worker; new exports get 503 beyond it.
+PDF_EXPORT_MAX_QUEUED = PDF_EXPORT_WORKERS * 4
+PDF_EXPORT_TTL = 3600
+PDF_POOL_WORKERS = int(os.getenv('PDF_POOL_WORKERS', 2))
+PDF_POOL_MAX_PENDING = 8
+PDF_RENDER_TIMEOUT = 30
+# Export jobs live in the worker's memory and are lost on restart: a job
+# pending longer than waiting for a pool slot plus rendering is failed.
+PDF_EXPORT_PENDING_TIMEOUT = PDF_RENDER_TIMEOUT * 2 + 60
+
+# Response compression: content type -> minimal size in bytes.
+# HTML is not compressed: admin pages carry CSRF tokens (BREACH).
+
+COMPRESSION_CONTENT_TYPES = {
+    'application/json': 1024,
+}
+
+# Cache settings: generation counters and responses of api.caching and
+# throttling buckets must be shared by all gunicorn workers, so they need
+# memcached. Without it responses are not cached (see api.caching).
+
+MEMCACHED_LOCATION = os.getenv('MEMCACHED_LOCATION')
+
+if MEMCACHED_LOCATION:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': MEMCACHED_LOCATION,
+        }
+    }
+
+# Responses are invalidated by api.caching on writes,
+# timeouts bound staleness after bulk operations that skip signals.
+
+VIEW_CACHE_TIMEOUT = 300
+FEED_CACHE_TIMEOUT = 30
+
+# Pagination settings
+
+ESTIMATED_COUNT_THRESHOLD = 10000
+PAGINATION_COUNT_CACHE_TIMEOUT = 30
+
+# Popularity settings
+
+TRENDING_DAYS = 7
+TRENDING_HALF_LIFE_HOURS = 24
+POPULARITY_BATCH_SIZE = 500
+
+# Similar recipes settings: ingredients found in more than
+# SIMILAR_MAX_INGREDIENT_SHARE of recipes (and in more than
+# SIMILAR_MIN_INGREDIENT_POSTINGS recipes) do not select candidates.
+
+SIMILAR_RECIPES_LIMIT = 10
+SIMILAR_TAG_WEIGHT = 0.25
+SIMILAR_MAX_INGREDIENT_SHARE = 0.05
+SIMILAR_MIN_INGREDIENT_POSTINGS = 1000
+SIMILARITY_BATCH_SIZE = 500
+
+# Recipe import/export settings
+
+RECIPE_TRANSFER_BATCH_SIZE = 1000
+RECIPE_TOTALS_BATCH_SIZE = 500
+
+# Full-text search settings
+
+SEARCH_CONFIG = 'russian'
 
 # Static files (CSS, JavaScript, Images)
 
@@ -134,6 +225,12 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Files with access checks are served by nginx from PROTECTED_MEDIA_URL
+# (an internal location aliased to MEDIA_ROOT) via X-Accel-Redirect.
+
+USE_X_ACCEL_REDIRECT = os.getenv('USE_X_ACCEL_REDIRECT') == 'True'
+PROTECTED_MEDIA_URL = '/protected/'
+
 # CSV Dir
 
 DATA_DIR = f'{BASE_DIR}/data'
@@ -155,10 +252,35 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    'DEFAULT_PAGINATION_CLASS': (
+        'api.pagination.EstimatedPageNumberPagination'
+    ),
     'PAGE_SIZE': 6,
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.TokenBucketThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'user': '120/min',
+        'anon': '60/min',
+    },
+    # Anonymous clients are identified by X-Forwarded-For set by nginx.
+    'NUM_PROXIES': 1,
 }
 
+# Throttling: every THROTTLE_OFFSET_COST_STEP rows of offset add one unit
+# to the cost of a list request.
+
+THROTTLE_OFFSET_COST_STEP = 1000
+
 # Djoser settings
 
 DJOSER = {
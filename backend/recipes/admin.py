@@ -1,5 +1,7 @@
 from django.contrib import admin
+from django.db.models import Count
 
+from api.caching import TRACKED_MODELS, invalidate_deleted
 from .models import (
     Tag,
     Recipe,
@@ -8,7 +10,33 @@ from .models import (
     Follow,
     ShoppingList,
     Favorite,
+    MealPlan,
 )
+from .utils import TOTAL_FIELDS, update_recipe_totals
+
+
+class FastDeleteAdminMixin:
+    """
+    Удаление записей моделей из api.caching.FAST_DELETE_MODELS, для
+    которых нет post_delete: кэш API сбрасывается одним вызовом на
+    модель и владельцев удаленных записей.
+    """
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        owner_field = TRACKED_MODELS[self.model]
+        invalidate_deleted(
+            self.model,
+            [getattr(obj, owner_field)] if owner_field else [],
+        )
+
+    def delete_queryset(self, request, queryset):
+        owner_field = TRACKED_MODELS[self.model]
+        owner_ids = (
+            list(queryset.values_list(owner_field, flat=True))
+            if owner_field else []
+        )
+        super().delete_queryset(request, queryset)
+        invalidate_deleted(self.model, owner_ids)
 
 
 @admin.register(Tag)
@@ -33,6 +61,7 @@ class TagAdmin(admin.ModelAdmin):
 class RecipeIngredientInline(admin.StackedInline):
     model = RecipeIngredient
     min_num = 1
+    autocomplete_fields = ('ingredient',)
 
 
 @admin.register(Recipe)
@@ -44,13 +73,27 @@ class RecipeAdmin(admin.ModelAdmin):
         'count_favorite',
     )
     inlines = (RecipeIngredientInline, )
+    autocomplete_fields = ('author',)
 
-    list_filter = ('author', 'name', 'tags')
+    list_filter = ('tags',)
+    list_select_related = ('author',)
     list_per_page = 10
-    search_fields = ('author', 'name')
+    search_fields = ('name', 'author__username', 'author__email')
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            favorite_count=Count('favorite', distinct=True),
+        )
+
+    @admin.display(ordering='favorite_count')
     def count_favorite(self, object):
-        return object.favorite.count()
+        return object.favorite_count
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if any(formset.deleted_objects for formset in formsets):
+            invalidate_deleted(RecipeIngredient)
+        update_recipe_totals([form.instance.id])
 
 
 @admin.register(Ingredient)
@@ -61,64 +104,104 @@ class IngredientAdmin(admin.ModelAdmin):
         'measurement_unit',
     )
 
-    list_filter = ('name',)
+    list_filter = ('measurement_unit',)
     list_per_page = 10
     search_fields = ('name',)
     ordering = ('pk',)
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and set(form.changed_data) & set(TOTAL_FIELDS.values()):
+            update_recipe_totals(
+                RecipeIngredient.objects.filter(
+                    ingredient=obj,
+                ).values_list('recipe_id', flat=True).distinct()
+            )
+
 
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(FastDeleteAdminMixin, admin.ModelAdmin):
     list_display = (
         'pk',
         'user',
         'recipe',
     )
-    list_editable = (
-        'user',
-        'recipe',
-    )
+    autocomplete_fields = ('user', 'recipe')
 
-    list_filter = ('user',)
-    search_fields = ('user',)
+    list_select_related = ('user', 'recipe')
+    search_fields = ('user__username', 'user__email', 'recipe__name')
     list_per_page = 10
 
 
 @admin.register(ShoppingList)
-class ShoppingListAdmin(admin.ModelAdmin):
+class ShoppingListAdmin(FastDeleteAdminMixin, admin.ModelAdmin):
     list_display = (
         'pk',
         'user',
         'recipe',
     )
-    list_editable = (
+    autocomplete_fields = ('user', 'recipe')
+
+    list_select_related = ('user', 'recipe')
+    search_fields = ('user__username', 'user__email', 'recipe__name')
+    list_per_page = 10
+
+
+@admin.register(MealPlan)
+class MealPlanAdmin(FastDeleteAdminMixin, admin.ModelAdmin):
+    list_display = (
+        'pk',
         'user',
+        'date',
         'recipe',
+        'servings',
     )
+    autocomplete_fields = ('user', 'recipe')
 
-    list_filter = ('user',)
-    search_fields = ('user',)
+    list_filter = ('date',)
+    list_select_related = ('user', 'recipe')
+    search_fields = ('user__username', 'user__email', 'recipe__name')
     list_per_page = 10
 
 
 @admin.register(RecipeIngredient)
-class RecipeIngredientAdmin(admin.ModelAdmin):
+class RecipeIngredientAdmin(FastDeleteAdminMixin, admin.ModelAdmin):
     list_display = (
         'pk',
         'recipe',
         'ingredient',
         'amount',
     )
+    autocomplete_fields = ('recipe', 'ingredient')
 
+    list_select_related = ('recipe', 'ingredient')
     list_per_page = 10
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        recipe_ids = {obj.recipe_id}
+        if change and 'recipe' in form.changed_data:
+            recipe_ids.add(form.initial['recipe'])
+        update_recipe_totals(recipe_ids)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        update_recipe_totals([obj.recipe_id])
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = set(queryset.values_list('recipe_id', flat=True))
+        super().delete_queryset(request, queryset)
+        update_recipe_totals(recipe_ids)
+
 
 @admin.register(Follow)
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(FastDeleteAdminMixin, admin.ModelAdmin):
     list_display = (
         'pk',
         'user',
         'following',
     )
+    autocomplete_fields = ('user', 'following')
 
+    list_select_related = ('user', 'following')
     list_per_page = 10
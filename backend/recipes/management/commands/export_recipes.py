@@ -0,0 +1,110 @@
+import json
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe, RecipeIngredient
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает рецепты с тегами, ингредиентами и путями к картинкам '
+        'в файл JSON Lines: один рецепт в строке.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Файл для выгрузки, "-" - стандартный вывод.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.RECIPE_TRANSFER_BATCH_SIZE,
+            help='Число рецептов, загружаемых из БД за раз.',
+        )
+
+    def get_batches(self, batch_size):
+        """Выбирает рецепты пачками по возрастанию id без OFFSET."""
+        last_id = 0
+        while True:
+            rows = list(
+                Recipe.objects.filter(
+                    id__gt=last_id,
+                ).order_by('id').values(
+                    'id',
+                    'author__email',
+                    'name',
+                    'text',
+                    'cooking_time',
+                    'image',
+                    'pub_date',
+                )[:batch_size]
+            )
+            if not rows:
+                return
+            last_id = rows[-1]['id']
+            yield rows
+
+    def get_related(self, recipe_ids):
+        """Загружает теги и ингредиенты пачки двумя запросами."""
+        tags = defaultdict(list)
+        for recipe_id, slug in Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids,
+        ).order_by('id').values_list('recipe_id', 'tag__slug'):
+            tags[recipe_id].append(slug)
+        ingredients = defaultdict(list)
+        for recipe_id, name, unit, amount in RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids,
+        ).order_by('id').values_list(
+            'recipe_id',
+            'ingredient__name',
+            'ingredient__measurement_unit',
+            'amount',
+        ):
+            ingredients[recipe_id].append({
+                'name': name,
+                'measurement_unit': unit,
+                'amount': amount,
+            })
+        return tags, ingredients
+
+    def export(self, output, batch_size, progress):
+        started = time.monotonic()
+        total = 0
+        for rows in self.get_batches(batch_size):
+            tags, ingredients = self.get_related([row['id'] for row in rows])
+            for row in rows:
+                output.write(json.dumps({
+                    'author': row['author__email'],
+                    'name': row['name'],
+                    'text': row['text'],
+                    'cooking_time': row['cooking_time'],
+                    'image': row['image'],
+                    'pub_date': row['pub_date'].isoformat(),
+                    'tags': tags[row['id']],
+                    'ingredients': ingredients[row['id']],
+                }, ensure_ascii=False))
+                output.write('\n')
+            total += len(rows)
+            elapsed = time.monotonic() - started
+            progress.write(
+                f'Выгружено {total} рецептов '
+                f'({total / elapsed:.0f} рецептов/с)'
+            )
+        return total
+
+    def handle(self, *args, **options):
+        progress = self.stdout
+        if options['path'] == '-':
+            progress = self.stderr
+            total = self.export(sys.stdout, options['batch_size'], progress)
+        else:
+            with open(options['path'], 'w', encoding='utf-8') as output:
+                total = self.export(output, options['batch_size'], progress)
+        progress.write(
+            self.style.SUCCESS(f'Выгрузка завершена: {total} рецептов')
+        )
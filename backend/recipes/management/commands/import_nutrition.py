@@ -0,0 +1,87 @@
+import csv
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import Ingredient, RecipeIngredient
+from recipes.utils import TOTAL_FIELDS, update_recipe_totals
+
+# Порядок колонок после названия и единицы измерения.
+NUTRITION_FIELDS = tuple(TOTAL_FIELDS.values())
+
+
+class Command(BaseCommand):
+    help = (
+        'Импортирует пищевую ценность и цену ингредиентов на единицу '
+        'измерения из csv-файла с колонками: название, единица измерения, '
+        'калории, белки, жиры, углеводы, цена. Пустая ячейка - нет данных. '
+        'Затем пересчитывает итоги рецептов с этими ингредиентами.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            required=True,
+            help='Путь к csv-файлу.',
+        )
+
+    def parse(self, row):
+        """
+        Превращает строку файла в ключ (название, единица измерения)
+        и значения полей. Бросает ValueError для неверных строк.
+        """
+        if len(row) != 2 + len(NUTRITION_FIELDS):
+            raise ValueError(
+                f'ожидается колонок: {2 + len(NUTRITION_FIELDS)}, '
+                f'получено: {len(row)}'
+            )
+        return (row[0], row[1]), {
+            field: float(value) if value else None
+            for field, value in zip(NUTRITION_FIELDS, row[2:])
+        }
+
+    def handle(self, *args, **options):
+        ingredients = {
+            (name, unit): pk
+            for pk, name, unit in Ingredient.objects.values_list(
+                'id',
+                'name',
+                'measurement_unit',
+            )
+        }
+        updated = []
+        not_found = 0
+        skipped = 0
+        with open(options['path'], encoding='utf-8') as csv_file:
+            reader = csv.reader(csv_file)
+            next(reader)
+            for number, row in enumerate(reader, 2):
+                try:
+                    key, values = self.parse(row)
+                except ValueError as error:
+                    skipped += 1
+                    self.stderr.write(f'Строка {number} пропущена: {error!r}')
+                    continue
+                pk = ingredients.get(key)
+                if pk is None:
+                    not_found += 1
+                    continue
+                updated.append(Ingredient(id=pk, **values))
+        with transaction.atomic():
+            Ingredient.objects.bulk_update(
+                updated,
+                NUTRITION_FIELDS,
+                batch_size=settings.RECIPE_TOTALS_BATCH_SIZE,
+            )
+            update_recipe_totals(
+                RecipeIngredient.objects.filter(
+                    ingredient_id__in=[ingredient.id for ingredient in updated],
+                ).values_list('recipe_id', flat=True).distinct()
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Обновлено ингредиентов: {len(updated)}, '
+                f'не найдено: {not_found}, пропущено строк: {skipped}'
+            )
+        )
@@ -0,0 +1,168 @@
+import json
+import sys
+import time
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag, User
+from recipes.utils import update_recipe_totals
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает рецепты из файла JSON Lines, созданного export_recipes. '
+        'Авторы, теги и ингредиенты должны уже быть в БД, картинки '
+        'указываются путем к файлу в хранилище медиа.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Файл для загрузки, "-" - стандартный ввод.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.RECIPE_TRANSFER_BATCH_SIZE,
+            help='Число рецептов, сохраняемых за одну транзакцию.',
+        )
+
+    # Поля, которые проверять не нужно: автор найден по словарю,
+    # остальные заполняет сама загрузка или пересчет итогов.
+    unchecked_fields = ['author'] + [
+        field.name for field in Recipe._meta.fields if not field.editable
+    ]
+
+    def load_maps(self):
+        """Словари для поиска id авторов, тегов и ингредиентов без БД."""
+        self.authors = dict(User.objects.values_list('email', 'id'))
+        self.tags = dict(Tag.objects.values_list('slug', 'id'))
+        self.ingredients = {
+            (name, unit): pk
+            for pk, name, unit in Ingredient.objects.values_list(
+                'id',
+                'name',
+                'measurement_unit',
+            )
+        }
+
+    def parse(self, line):
+        """
+        Превращает строку файла в рецепт, id тегов и пары
+        (id ингредиента, количество). Повторы тегов отбрасываются,
+        количества повторяющегося ингредиента складываются. Поля
+        проверяются валидаторами моделей (длина, COOKING_TIME_*,
+        AMOUNT_*). Бросает KeyError, ValueError или ValidationError
+        для неизвестных ссылок и неверных строк, чтобы строка была
+        пропущена до записи в БД.
+        """
+        data = json.loads(line)
+        pub_date = parse_datetime(data['pub_date'])
+        if pub_date is None:
+            raise ValueError(f'Неверная дата: {data["pub_date"]!r}')
+        amounts = {}
+        for ingredient in data['ingredients']:
+            ingredient_id = self.ingredients[
+                (ingredient['name'], ingredient['measurement_unit'])
+            ]
+            amounts[ingredient_id] = (
+                amounts.get(ingredient_id, 0) + ingredient['amount']
+            )
+        ingredients = []
+        for ingredient_id, amount in amounts.items():
+            row = RecipeIngredient(amount=amount)
+            row.clean_fields(exclude=('recipe', 'ingredient'))
+            ingredients.append((ingredient_id, row.amount))
+        recipe = Recipe(
+            author_id=self.authors[data['author']],
+            name=data['name'],
+            text=data['text'],
+            cooking_time=data['cooking_time'],
+            image=data['image'],
+            pub_date=pub_date,
+            ingredients_count=len(ingredients),
+        )
+        recipe.clean_fields(exclude=self.unchecked_fields)
+        tags = list(dict.fromkeys(self.tags[slug] for slug in data['tags']))
+        return recipe, tags, ingredients
+
+    @transaction.atomic
+    def save_batch(self, batch):
+        """Сохраняет пачку рецептов с тегами и ингредиентами."""
+        recipes = [recipe for recipe, _, _ in batch]
+        # auto_now_add перезаписывает pub_date при вставке.
+        pub_dates = [recipe.pub_date for recipe in recipes]
+        if connection.features.can_return_rows_from_bulk_insert:
+            Recipe.objects.bulk_create(recipes)
+        else:
+            for recipe in recipes:
+                recipe.save()
+        for recipe, pub_date in zip(recipes, pub_dates):
+            recipe.pub_date = pub_date
+        Recipe.objects.bulk_update(recipes, ('pub_date',))
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=tag_id)
+            for recipe, tags, _ in batch
+            for tag_id in tags
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe_id=recipe.id,
+                ingredient_id=ingredient_id,
+                amount=amount,
+            )
+            for recipe, _, ingredients in batch
+            for ingredient_id, amount in ingredients
+        )
+        update_recipe_totals(recipe.id for recipe in recipes)
+
+    def load(self, lines, batch_size):
+        started = time.monotonic()
+        total = 0
+        skipped = 0
+        batch = []
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                batch.append(self.parse(line))
+            except (
+                KeyError,
+                TypeError,
+                ValueError,
+                ValidationError,
+            ) as error:
+                skipped += 1
+                self.stderr.write(f'Строка {number} пропущена: {error!r}')
+                continue
+            if len(batch) < batch_size:
+                continue
+            self.save_batch(batch)
+            total += len(batch)
+            batch = []
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'Загружено {total} рецептов '
+                f'({total / elapsed:.0f} рецептов/с)'
+            )
+        if batch:
+            self.save_batch(batch)
+            total += len(batch)
+        return total, skipped
+
+    def handle(self, *args, **options):
+        self.load_maps()
+        if options['path'] == '-':
+            total, skipped = self.load(sys.stdin, options['batch_size'])
+        else:
+            with open(options['path'], encoding='utf-8') as lines:
+                total, skipped = self.load(lines, options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Загрузка завершена: {total} рецептов, пропущено {skipped}'
+            )
+        )
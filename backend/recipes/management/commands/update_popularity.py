@@ -0,0 +1,111 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from recipes.models import Favorite, Recipe, RecipePopularity, ShoppingList
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает популярность рецептов. По умолчанию пересчитываются '
+        'только рецепты с активностью с прошлого запуска или за последние '
+        'N дней, с флагом --full - все рецепты.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.TRENDING_DAYS,
+            help='Окно для расчета тренда в днях.',
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Пересчитать все рецепты.',
+        )
+
+    def get_trending(self, now, since):
+        """Считает затухающую по времени сумму добавлений за окно."""
+        half_life = settings.TRENDING_HALF_LIFE_HOURS * 3600
+        trending = defaultdict(float)
+        for model in (Favorite, ShoppingList):
+            rows = model.objects.filter(
+                pub_date__gte=since,
+            ).values_list('recipe_id', 'pub_date').iterator()
+            for recipe_id, pub_date in rows:
+                age = (now - pub_date).total_seconds()
+                trending[recipe_id] += 0.5 ** (age / half_life)
+        return trending
+
+    def get_changed(self, trending):
+        """Возвращает id рецептов, чья популярность могла измениться."""
+        changed = set(trending)
+        changed.update(
+            RecipePopularity.objects.filter(
+                trending__gt=0,
+            ).values_list('recipe_id', flat=True)
+        )
+        last_run = RecipePopularity.objects.aggregate(
+            Max('updated'),
+        )['updated__max']
+        if last_run is not None:
+            for model in (Favorite, ShoppingList):
+                changed.update(
+                    model.objects.filter(
+                        pub_date__gte=last_run,
+                    ).values_list('recipe_id', flat=True)
+                )
+        return changed
+
+    def get_popular(self, recipe_ids):
+        """Считает число добавлений в избранное и в корзину."""
+        popular = defaultdict(int)
+        for model in (Favorite, ShoppingList):
+            rows = model.objects.filter(
+                recipe_id__in=recipe_ids,
+            ).values('recipe_id').annotate(
+                total=Count('id'),
+            ).order_by().values_list('recipe_id', 'total')
+            for recipe_id, total in rows:
+                popular[recipe_id] += total
+        return popular
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        trending = self.get_trending(
+            now,
+            now - timedelta(days=options['days']),
+        )
+        if options['full']:
+            recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+        else:
+            recipe_ids = list(
+                Recipe.objects.filter(
+                    id__in=self.get_changed(trending),
+                ).values_list('id', flat=True)
+            )
+        batch_size = settings.POPULARITY_BATCH_SIZE
+        for start in range(0, len(recipe_ids), batch_size):
+            batch = recipe_ids[start:start + batch_size]
+            popular = self.get_popular(batch)
+            with transaction.atomic():
+                RecipePopularity.objects.filter(recipe_id__in=batch).delete()
+                RecipePopularity.objects.bulk_create(
+                    RecipePopularity(
+                        recipe_id=recipe_id,
+                        popular=popular[recipe_id],
+                        trending=trending[recipe_id],
+                        updated=now,
+                    ) for recipe_id in batch
+                )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Популярность пересчитана для {len(recipe_ids)} рецептов'
+            )
+        )
@@ -0,0 +1,161 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from recipes.models import Recipe, RecipeIngredient, RecipeSimilarity
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает похожие рецепты по коэффициенту Жаккара для '
+        'ингредиентов и тегов. По умолчанию пересчитываются рецепты, '
+        'измененные с прошлого запуска, и рецепты с общими с ними '
+        'ингредиентами, с флагом --full - все рецепты.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Пересчитать все рецепты.',
+        )
+
+    def load_vectors(self):
+        """
+        Загружает разреженные векторы рецептов (множества id ингредиентов
+        и тегов) и обратный индекс ингредиент -> рецепты.
+        """
+        ingredients = defaultdict(set)
+        for recipe_id, ingredient_id in RecipeIngredient.objects.values_list(
+            'recipe_id',
+            'ingredient_id',
+        ).iterator():
+            ingredients[recipe_id].add(ingredient_id)
+        tags = defaultdict(set)
+        for recipe_id, tag_id in Recipe.tags.through.objects.values_list(
+            'recipe_id',
+            'tag_id',
+        ).iterator():
+            tags[recipe_id].add(tag_id)
+        index = defaultdict(list)
+        for recipe_id, recipe_ingredients in ingredients.items():
+            for ingredient_id in recipe_ingredients:
+                index[ingredient_id].append(recipe_id)
+        # Ингредиенты, которые есть почти везде (соль, вода), не отбирают
+        # кандидатов, но учитываются в сходстве.
+        max_postings = max(
+            settings.SIMILAR_MIN_INGREDIENT_POSTINGS,
+            int(len(ingredients) * settings.SIMILAR_MAX_INGREDIENT_SHARE),
+        )
+        index = {
+            ingredient_id: recipe_ids
+            for ingredient_id, recipe_ids in index.items()
+            if len(recipe_ids) <= max_postings
+        }
+        return ingredients, tags, index
+
+    @staticmethod
+    def jaccard(first, second):
+        if not first or not second:
+            return 0
+        shared = len(first & second)
+        return shared / (len(first) + len(second) - shared)
+
+    @staticmethod
+    def get_candidates(recipe_id, ingredients, index):
+        """Рецепты с общими ингредиентами по обратному индексу."""
+        candidates = set()
+        for ingredient_id in ingredients[recipe_id]:
+            candidates.update(index.get(ingredient_id, ()))
+        candidates.discard(recipe_id)
+        return candidates
+
+    def get_similar(self, recipe_id, ingredients, tags, index):
+        """Лучшие SIMILAR_RECIPES_LIMIT рецептов, похожих на recipe_id."""
+        candidates = self.get_candidates(recipe_id, ingredients, index)
+        tag_weight = settings.SIMILAR_TAG_WEIGHT
+        scores = [
+            (
+                (1 - tag_weight) * self.jaccard(
+                    ingredients[recipe_id],
+                    ingredients[candidate],
+                )
+                + tag_weight * self.jaccard(tags[recipe_id], tags[candidate]),
+                candidate,
+            )
+            for candidate in candidates
+        ]
+        scores.sort(reverse=True)
+        return scores[:settings.SIMILAR_RECIPES_LIMIT]
+
+    def get_changed(self, ingredients, index):
+        """
+        Рецепты, измененные с прошлого пересчета, и рецепты, у которых
+        они были среди похожих или могут стать похожими.
+        None, если пересчета еще не было.
+        """
+        last_run = RecipeSimilarity.objects.aggregate(
+            Max('updated'),
+        )['updated__max']
+        if last_run is None:
+            return None
+        changed = set(
+            Recipe.objects.filter(
+                updated__gte=last_run,
+            ).values_list('id', flat=True)
+        )
+        affected = set(
+            RecipeSimilarity.objects.filter(
+                similar_id__in=changed,
+            ).values_list('recipe_id', flat=True)
+        )
+        for recipe_id in changed:
+            affected.update(
+                self.get_candidates(recipe_id, ingredients, index)
+            )
+        return changed | affected
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        ingredients, tags, index = self.load_vectors()
+        changed = None
+        if not options['full']:
+            changed = self.get_changed(ingredients, index)
+        if changed is None:
+            recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+        else:
+            recipe_ids = list(
+                Recipe.objects.filter(
+                    id__in=changed,
+                ).values_list('id', flat=True)
+            )
+        batch_size = settings.SIMILARITY_BATCH_SIZE
+        for start in range(0, len(recipe_ids), batch_size):
+            batch = recipe_ids[start:start + batch_size]
+            with transaction.atomic():
+                RecipeSimilarity.objects.filter(recipe_id__in=batch).delete()
+                RecipeSimilarity.objects.bulk_create(
+                    RecipeSimilarity(
+                        recipe_id=recipe_id,
+                        similar_id=similar_id,
+                        score=score,
+                        updated=now,
+                    )
+                    for recipe_id in batch
+                    for score, similar_id in self.get_similar(
+                        recipe_id,
+                        ingredients,
+                        tags,
+                        index,
+                    )
+                    if score > 0
+                )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Похожие рецепты пересчитаны для {len(recipe_ids)} рецептов'
+            )
+        )
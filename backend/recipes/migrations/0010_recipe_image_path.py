@@ -0,0 +1,19 @@
+# Generated by Django 3.2.3 on 2026-10-19 08:21
+
+from django.db import migrations, models
+import recipes.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(upload_to=recipes.models.recipe_image_path, verbose_name='Картинка'),
+        ),
+    ]
@@ -1,5 +1,10 @@
+import hashlib
+import os
+import uuid
+
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, MaxValueValidator
 
 from django.conf import settings
@@ -7,6 +12,18 @@ from django.conf import settings
 User = get_user_model()
 
 
+def recipe_image_path(instance, filename):
+    """
+    Имя картинки по хэшу содержимого: файл по одному адресу не меняется,
+    поэтому nginx может отдавать его с долгим кэшированием.
+    """
+    hasher = hashlib.sha256()
+    for chunk in instance.image.chunks():
+        hasher.update(chunk)
+    extension = os.path.splitext(filename)[1].lower()
+    return f'recipe/images/{hasher.hexdigest()[:32]}{extension}'
+
+
 class Tag(models.Model):
     """Модель для хранения информации о тэге."""
     name = models.CharField(
@@ -45,6 +62,32 @@ class Ingredient(models.Model):
         verbose_name='Единица измерения',
         max_length=200,
     )
+    # Пищевая ценность и цена на одну единицу измерения.
+    calories = models.FloatField(
+        verbose_name='Калории',
+        null=True,
+        blank=True,
+    )
+    proteins = models.FloatField(
+        verbose_name='Белки',
+        null=True,
+        blank=True,
+    )
+    fats = models.FloatField(
+        verbose_name='Жиры',
+        null=True,
+        blank=True,
+    )
+    carbohydrates = models.FloatField(
+        verbose_name='Углеводы',
+        null=True,
+        blank=True,
+    )
+    price = models.FloatField(
+        verbose_name='Цена',
+        null=True,
+        blank=True,
+    )
 
     class Meta:
         verbose_name = 'Ингредиент'
@@ -66,7 +109,7 @@ class Recipe(models.Model):
     name = models.CharField(verbose_name='Название рецепта', max_length=200)
     image = models.ImageField(
         verbose_name='Картинка',
-        upload_to='recipe/images/'
+        upload_to=recipe_image_path,
     )
     text = models.TextField(verbose_name='Описание')
     cooking_time = models.PositiveSmallIntegerField(
@@ -95,11 +138,58 @@ class Recipe(models.Model):
         verbose_name='Дата публикации',
         auto_now_add=True,
     )
+    updated = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+    )
+    ingredients_count = models.PositiveSmallIntegerField(
+        verbose_name='Кол-во ингредиентов',
+        default=0,
+        editable=False,
+    )
+    # Итоги по ингредиентам, пересчитываются update_recipe_totals.
+    calories = models.FloatField(
+        verbose_name='Калории',
+        null=True,
+        editable=False,
+    )
+    proteins = models.FloatField(
+        verbose_name='Белки',
+        null=True,
+        editable=False,
+    )
+    fats = models.FloatField(
+        verbose_name='Жиры',
+        null=True,
+        editable=False,
+    )
+    carbohydrates = models.FloatField(
+        verbose_name='Углеводы',
+        null=True,
+        editable=False,
+    )
+    cost = models.FloatField(
+        verbose_name='Стоимость',
+        null=True,
+        editable=False,
+    )
+    # Заполняется триггером PostgreSQL, индексируется GIN (миграция 0009).
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(
+                fields=('author', '-pub_date'),
+                name='recipe_author_pub_date_idx',
+            ),
+        )
 
     def __str__(self):
         return f'Рецепт: {self.name}'
@@ -138,6 +228,12 @@ class RecipeIngredient(models.Model):
         verbose_name = 'Количество ингредиента'
         verbose_name_plural = 'Количество ингредиентов'
         ordering = ('id',)
+        indexes = (
+            models.Index(
+                fields=('ingredient', 'recipe'),
+                name='ingredient_recipe_idx',
+            ),
+        )
 
     def __str__(self):
         return f'{self.recipe} -> {self.ingredient}'
@@ -237,3 +333,166 @@ class Favorite(models.Model):
 
     def __str__(self):
         return f'Пользователь: {self.user} добавил {self.recipe}'
+
+
+class MealPlan(models.Model):
+    """Модель для хранения рецептов в плане питания пользователя по дням."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+    )
+    date = models.DateField(verbose_name='Дата')
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт',
+    )
+    servings = models.PositiveSmallIntegerField(
+        verbose_name='Кол-во порций',
+        default=1,
+        validators=(
+            MinValueValidator(
+                settings.SERVINGS_MIN,
+                message='Минимальное количество порций 1!',
+            ),
+            MaxValueValidator(
+                settings.SERVINGS_MAX,
+                message='Максимальное количество порций 100!',
+            ),
+        )
+    )
+
+    class Meta:
+        verbose_name = 'План питания'
+        verbose_name_plural = 'Планы питания'
+        default_related_name = 'meal_plan'
+        ordering = ('date', 'id')
+        indexes = (
+            models.Index(
+                fields=('user', 'date'),
+                name='meal_plan_user_date_idx',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.user}: {self.date} {self.recipe} x{self.servings}'
+
+
+class RecipePopularity(models.Model):
+    """Модель для хранения предрассчитанной популярности рецепта."""
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='popularity',
+        verbose_name='Рецепт',
+    )
+    popular = models.PositiveIntegerField(
+        verbose_name='Популярность',
+        default=0,
+    )
+    trending = models.FloatField(
+        verbose_name='Тренд',
+        default=0,
+    )
+    updated = models.DateTimeField(verbose_name='Дата пересчета')
+
+    class Meta:
+        verbose_name = 'Популярность рецепта'
+        verbose_name_plural = 'Популярность рецептов'
+        indexes = (
+            models.Index(
+                fields=('-popular',),
+                name='recipe_popular_idx',
+            ),
+            models.Index(
+                fields=('-trending',),
+                name='recipe_trending_idx',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.recipe}: {self.popular} / {self.trending:.2f}'
+
+
+class RecipeSimilarity(models.Model):
+    """
+    Модель для хранения предрассчитанных похожих рецептов: для каждого
+    рецепта хранятся лучшие по сходству ингредиентов и тегов.
+    """
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar',
+        verbose_name='Рецепт',
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_to',
+        verbose_name='Похожий рецепт',
+    )
+    score = models.FloatField(verbose_name='Сходство')
+    updated = models.DateTimeField(verbose_name='Дата пересчета')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        indexes = (
+            models.Index(
+                fields=('recipe', '-score'),
+                name='recipe_similarity_score_idx',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.recipe} ~ {self.similar}: {self.score:.2f}'
+
+
+class ShoppingListExport(models.Model):
+    """Модель для хранения заданий на формирование pdf списка покупок."""
+    PENDING = 'pending'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'В очереди'),
+        (READY, 'Готово'),
+        (FAILED, 'Ошибка'),
+    )
+
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False,
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_exports',
+        verbose_name='Пользователь',
+    )
+    status = models.CharField(
+        verbose_name='Статус',
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+    )
+    file = models.FileField(
+        verbose_name='Файл',
+        upload_to='shopping_lists/',
+        blank=True,
+    )
+    created = models.DateTimeField(
+        verbose_name='Дата создания',
+        auto_now_add=True,
+        db_index=True,
+    )
+
+    class Meta:
+        verbose_name = 'Выгрузка списка покупок'
+        verbose_name_plural = 'Выгрузки списка покупок'
+        ordering = ('-created',)
+
+    def __str__(self):
+        return f'Выгрузка {self.id} для {self.user}: {self.status}'
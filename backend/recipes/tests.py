@@ -0,0 +1,426 @@
+import datetime
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .models import (
+    Favorite,
+    Follow,
+    Ingredient,
+    MealPlan,
+    Recipe,
+    RecipeIngredient,
+    ShoppingList,
+    Tag,
+    User,
+)
+from .utils import update_recipe_totals
+
+
+# Данные TestCase не видны через соединение реплики.
+@override_settings(REPLICA_DATABASE=None)
+class AdminChangelistQueriesTest(TestCase):
+    """
+    Число запросов страниц списков в админке не зависит от числа строк:
+    связанные объекты и счетчики загружаются вместе со страницей.
+    """
+    rows = 5
+    # Модель -> число запросов, включая сессию и пользователя админки.
+    expected_queries = {
+        'recipes_tag': 6,
+        'recipes_recipe': 6,
+        'recipes_ingredient': 6,
+        'recipes_favorite': 5,
+        'recipes_shoppinglist': 5,
+        'recipes_mealplan': 5,
+        'recipes_recipeingredient': 5,
+        'recipes_follow': 5,
+        'users_user': 5,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.superuser = User.objects.create_superuser(
+            email='admin@example.com',
+            username='admin',
+            first_name='Админ',
+            last_name='Админов',
+            password='password',
+        )
+        users = [
+            User.objects.create_user(
+                email=f'user{i}@example.com',
+                username=f'user{i}',
+                first_name='Пользователь',
+                last_name=str(i),
+                password='password',
+            )
+            for i in range(cls.rows)
+        ]
+        tags = [
+            Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}', slug=f't{i}')
+            for i in range(cls.rows)
+        ]
+        ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}', measurement_unit='г')
+            for i in range(cls.rows)
+        ]
+        for i, user in enumerate(users):
+            recipe = Recipe.objects.create(
+                author=user,
+                name=f'Рецепт {i}',
+                text='Описание',
+                cooking_time=10,
+                image='recipe/images/test.png',
+                ingredients_count=len(ingredients),
+            )
+            recipe.tags.set(tags)
+            for ingredient in ingredients:
+                RecipeIngredient.objects.create(
+                    recipe=recipe,
+                    ingredient=ingredient,
+                    amount=1,
+                )
+            for follower in users:
+                Favorite.objects.create(user=follower, recipe=recipe)
+                ShoppingList.objects.create(user=follower, recipe=recipe)
+                MealPlan.objects.create(
+                    user=follower,
+                    recipe=recipe,
+                    date=datetime.date(2026, 1, 1),
+                )
+                if follower != user:
+                    Follow.objects.create(user=follower, following=user)
+
+    def setUp(self):
+        self.client.force_login(self.superuser)
+
+    def test_changelists(self):
+        for model, queries in self.expected_queries.items():
+            with self.subTest(model=model):
+                with self.assertNumQueries(queries):
+                    response = self.client.get(
+                        reverse(f'admin:{model}_changelist')
+                    )
+                self.assertEqual(response.status_code, 200)
+
+
+class RecipeTransferTest(TestCase):
+    """Выгрузка, загрузка и повторная выгрузка рецептов совпадают."""
+    recipes = int(os.getenv('RECIPE_TRANSFER_TEST_COUNT', 25))
+    batch_size = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        authors = [
+            User.objects.create_user(
+                email=f'author{i}@example.com',
+                username=f'author{i}',
+                first_name='Автор',
+                last_name=str(i),
+                password='password',
+            )
+            for i in range(3)
+        ]
+        tags = [
+            Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}', slug=f't{i}')
+            for i in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}', measurement_unit='г')
+            for i in range(5)
+        ]
+        for i in range(cls.recipes):
+            recipe = Recipe.objects.create(
+                author=authors[i % len(authors)],
+                name=f'Рецепт {i}',
+                text=f'Описание "{i}"\nвторая строка',
+                cooking_time=i + 1,
+                image=f'recipe/images/{i}.png',
+                ingredients_count=i % len(ingredients) + 1,
+            )
+            recipe.tags.set(tags[:i % len(tags) + 1])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe,
+                    ingredient=ingredient,
+                    amount=i + j + 1,
+                )
+                for j, ingredient in enumerate(
+                    ingredients[:i % len(ingredients) + 1]
+                )
+            )
+
+    def export(self, path):
+        call_command(
+            'export_recipes',
+            path,
+            batch_size=self.batch_size,
+            stdout=StringIO(),
+        )
+        with open(path, encoding='utf-8') as exported:
+            return exported.read()
+
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            exported = self.export(os.path.join(directory, 'first.jsonl'))
+            Recipe.objects.all().delete()
+            call_command(
+                'import_recipes',
+                os.path.join(directory, 'first.jsonl'),
+                batch_size=self.batch_size,
+                stdout=StringIO(),
+                stderr=StringIO(),
+            )
+            reexported = self.export(os.path.join(directory, 'second.jsonl'))
+        self.assertEqual(len(exported.splitlines()), self.recipes)
+        self.assertEqual(reexported, exported)
+
+
+class ImportNutritionTest(TestCase):
+    """Загрузка пищевой ценности и цены ингредиентов из csv."""
+    def test_import(self):
+        author = User.objects.create_user(
+            email='author@example.com',
+            username='author',
+            first_name='Автор',
+            last_name='Рецептов',
+            password='password',
+        )
+        flour = Ingredient.objects.create(name='Мука', measurement_unit='г')
+        sugar = Ingredient.objects.create(name='Сахар', measurement_unit='г')
+        recipe = Recipe.objects.create(
+            author=author,
+            name='Пирог',
+            text='Описание',
+            cooking_time=10,
+            image='recipe/images/test.png',
+            ingredients_count=2,
+        )
+        RecipeIngredient.objects.create(
+            recipe=recipe,
+            ingredient=flour,
+            amount=100,
+        )
+        RecipeIngredient.objects.create(
+            recipe=recipe,
+            ingredient=sugar,
+            amount=10,
+        )
+        stdout, stderr = StringIO(), StringIO()
+        with tempfile.NamedTemporaryFile(
+            'w',
+            suffix='.csv',
+            encoding='utf-8',
+        ) as csv_file:
+            csv_file.write(
+                'name,unit,calories,proteins,fats,carbohydrates,price\n'
+                'Мука,г,3.5,0.1,0.01,0.7,0.05\n'
+                'Сахар,г,много,0,0,1,0.1\n'
+                'Соль,г,0,0,0,0,0.02\n'
+                'Сахар,г,4\n'
+            )
+            csv_file.flush()
+            call_command(
+                'import_nutrition',
+                path=csv_file.name,
+                stdout=stdout,
+                stderr=stderr,
+            )
+        self.assertIn('Строка 3 пропущена', stderr.getvalue())
+        self.assertIn('Строка 5 пропущена', stderr.getvalue())
+        self.assertIn(
+            'Обновлено ингредиентов: 1, не найдено: 1, пропущено строк: 2',
+            stdout.getvalue(),
+        )
+        recipe.refresh_from_db()
+        self.assertAlmostEqual(recipe.calories, 350)
+        self.assertAlmostEqual(recipe.cost, 5)
+
+
+# Данные TestCase не видны через соединение реплики.
+@override_settings(REPLICA_DATABASE=None)
+class RecipeIngredientAdminTest(TestCase):
+    """
+    Изменения ингредиентов рецепта в админке пересчитывают итоги
+    и число ингредиентов.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.superuser = User.objects.create_superuser(
+            email='admin@example.com',
+            username='admin',
+            first_name='Админ',
+            last_name='Админов',
+            password='password',
+        )
+        cls.flour = Ingredient.objects.create(
+            name='Мука',
+            measurement_unit='г',
+            calories=3,
+            price=0.1,
+        )
+        cls.sugar = Ingredient.objects.create(
+            name='Сахар',
+            measurement_unit='г',
+            calories=4,
+            price=0.2,
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.superuser,
+                name=f'Рецепт {i}',
+                text='Описание',
+                cooking_time=10,
+                image='recipe/images/test.png',
+            )
+            for i in range(2)
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.superuser)
+
+    def assertTotals(self, recipe, calories, cost):
+        recipe.refresh_from_db()
+        self.assertAlmostEqual(recipe.calories or 0, calories)
+        self.assertAlmostEqual(recipe.cost or 0, cost)
+        self.assertEqual(
+            recipe.ingredients_count,
+            RecipeIngredient.objects.filter(recipe=recipe).count(),
+        )
+
+    def save(self, url, recipe, ingredient, amount):
+        response = self.client.post(url, {
+            'recipe': recipe.id,
+            'ingredient': ingredient.id,
+            'amount': amount,
+        })
+        self.assertEqual(response.status_code, 302)
+
+    def test_add_change_delete(self):
+        first, second = self.recipes
+        self.save(
+            reverse('admin:recipes_recipeingredient_add'),
+            first,
+            self.flour,
+            100,
+        )
+        self.assertTotals(first, 300, 10)
+        row = RecipeIngredient.objects.get()
+        self.save(
+            reverse('admin:recipes_recipeingredient_change', args=(row.id,)),
+            second,
+            self.sugar,
+            10,
+        )
+        self.assertTotals(first, 0, 0)
+        self.assertTotals(second, 40, 2)
+        response = self.client.post(
+            reverse('admin:recipes_recipeingredient_delete', args=(row.id,)),
+            {'post': 'yes'},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertTotals(second, 0, 0)
+
+    def test_delete_selected(self):
+        rows = [
+            RecipeIngredient.objects.create(
+                recipe=recipe,
+                ingredient=self.flour,
+                amount=10,
+            )
+            for recipe in self.recipes
+        ]
+        update_recipe_totals(recipe.id for recipe in self.recipes)
+        self.assertTotals(self.recipes[0], 30, 1)
+        response = self.client.post(
+            reverse('admin:recipes_recipeingredient_changelist'),
+            {
+                'action': 'delete_selected',
+                '_selected_action': [row.id for row in rows],
+                'post': 'yes',
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        for recipe in self.recipes:
+            self.assertTotals(recipe, 0, 0)
+
+
+class ImportRecipesValidationTest(TestCase):
+    """Неверные строки файла рецептов пропускаются до записи в БД."""
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user(
+            email='author@example.com',
+            username='author',
+            first_name='Автор',
+            last_name='Рецептов',
+            password='password',
+        )
+        Tag.objects.create(name='Завтрак', color='#000000', slug='breakfast')
+        cls.flour = Ingredient.objects.create(name='Мука', measurement_unit='г')
+
+    def line(self, **changes):
+        data = {
+            'author': 'author@example.com',
+            'name': 'Блины',
+            'text': 'Описание',
+            'cooking_time': 30,
+            'image': 'recipe/images/test.png',
+            'pub_date': '2026-01-01T10:00:00+00:00',
+            'tags': ['breakfast'],
+            'ingredients': [
+                {'name': 'Мука', 'measurement_unit': 'г', 'amount': 200},
+            ],
+        }
+        data.update(changes)
+        return json.dumps(data, ensure_ascii=False)
+
+    def test_bad_lines_skipped(self):
+        lines = [
+            self.line(pub_date='вчера'),
+            self.line(cooking_time=-5),
+            self.line(cooking_time=settings.COOKING_TIME_MAX + 1),
+            self.line(ingredients=[
+                {'name': 'Мука', 'measurement_unit': 'г', 'amount': -1},
+            ]),
+            self.line(name='Б' * 201),
+            self.line(
+                tags=['breakfast', 'breakfast'],
+                ingredients=[
+                    {'name': 'Мука', 'measurement_unit': 'г', 'amount': 150},
+                    {'name': 'Мука', 'measurement_unit': 'г', 'amount': 50},
+                ],
+            ),
+        ]
+        stdout, stderr = StringIO(), StringIO()
+        with tempfile.NamedTemporaryFile(
+            'w',
+            suffix='.jsonl',
+            encoding='utf-8',
+        ) as recipes_file:
+            recipes_file.write('\n'.join(lines) + '\n')
+            recipes_file.flush()
+            call_command(
+                'import_recipes',
+                recipes_file.name,
+                batch_size=2,
+                stdout=stdout,
+                stderr=stderr,
+            )
+        for number in range(1, 6):
+            self.assertIn(f'Строка {number} пропущена', stderr.getvalue())
+        self.assertIn('1 рецептов, пропущено 5', stdout.getvalue())
+        recipe = Recipe.objects.get()
+        self.assertEqual(recipe.tags.count(), 1)
+        self.assertEqual(
+            list(recipe.recipe.values_list('ingredient_id', 'amount')),
+            [(self.flour.id, 200)],
+        )
+        self.assertEqual(recipe.ingredients_count, 1)
@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.db.models import Count, F, FloatField, Sum
+
+from .models import Recipe, RecipeIngredient
+
+# Поле итога рецепта -> поле ингредиента на единицу измерения.
+TOTAL_FIELDS = {
+    'calories': 'calories',
+    'proteins': 'proteins',
+    'fats': 'fats',
+    'carbohydrates': 'carbohydrates',
+    'cost': 'price',
+}
+
+
+def update_recipe_totals(recipe_ids):
+    """
+    Пересчитывает пищевую ценность, стоимость и число ингредиентов
+    рецептов: на каждую пачку из RECIPE_TOTALS_BATCH_SIZE рецептов один
+    агрегирующий запрос по RecipeIngredient и один bulk_update.
+    Ингредиенты без данных в сумму не входят. Вызывается при каждом
+    изменении ингредиентов рецепта: по ingredients_count фильтр
+    ?ingredients считает покрытие рецепта.
+    """
+    recipe_ids = list(recipe_ids)
+    batch_size = settings.RECIPE_TOTALS_BATCH_SIZE
+    for start in range(0, len(recipe_ids), batch_size):
+        update_batch_totals(recipe_ids[start:start + batch_size])
+
+
+def update_batch_totals(recipe_ids):
+    totals = {
+        row.pop('recipe_id'): row
+        for row in RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids,
+        ).values('recipe_id').annotate(
+            ingredients_count=Count('id'),
+            **{
+                name: Sum(
+                    F('amount') * F(f'ingredient__{field}'),
+                    output_field=FloatField(),
+                )
+                for name, field in TOTAL_FIELDS.items()
+            },
+        ).order_by()
+    }
+    Recipe.objects.bulk_update(
+        [
+            Recipe(
+                id=recipe_id,
+                **totals.get(recipe_id, {'ingredients_count': 0}),
+            )
+            for recipe_id in recipe_ids
+        ],
+        ('ingredients_count', *TOTAL_FIELDS),
+    )
@@ -24,4 +24,5 @@ class UserAdmin(admin.ModelAdmin):
     )
 
     list_per_page = 10
-    list_filter = ('email', 'username')
+    list_filter = ('is_staff', 'is_active')
+    search_fields = ('username', 'email')